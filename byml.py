@@ -1,6 +1,11 @@
 from utils import *
 import os
 import json
+import struct
+import gc
+import builtins
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
 try:
     import yaml
 except ImportError:
@@ -29,6 +34,11 @@ Double                  = 0xD6
 Null                    = 0xFF
 """
 
+# Precompiled decoders for the parser, keyed by byte order -> (u32, s32, u64, s64, f32, f64)
+_DECODERS = {end: tuple(struct.Struct(end + code).unpack_from for code in "IiQqfd") for end in "<>"}
+# Byte order -> {(code, count): decoder} for runs of values, filled as counts are seen
+_ARRAY_DECODERS = {"<": {}, ">": {}}
+
 class Int(int):
     pass
 
@@ -65,8 +75,17 @@ def add_constructors(loader):
     yaml.add_constructor(u'!f64', lambda l, node: Double(l.construct_yaml_float(node)), Loader=loader)
 
 class Byml:
-    def __init__(self, data, filename=''):
-        if type(data) != bytes:
+    lazy = False
+
+    # Takes a BYML/YAML file or raw bytes (any buffer) as input, use_mmap maps BYML files instead of reading them
+    # With lazy, dictionaries and arrays are read-only LazyDictionary/LazyArray proxies that decode their children
+    # on first access, call Materialize() to convert the tree into plain dicts and lists for editing
+    # With share_nodes, containers referenced from several offsets (the writer deduplicates identical subtrees)
+    # are decoded once and the same object is shared by every reference - use Unshare() before editing one in place
+    # pause_gc turns the garbage collector off during an eager parse, which is noticeably faster on large files but
+    # affects the whole process, so it shouldn't be used while other threads are running
+    def __init__(self, data, filename='', use_mmap=False, lazy=False, share_nodes=False, pause_gc=False):
+        if isinstance(data, (str, os.PathLike)):
             self.filename = os.path.basename(data)
             if os.path.splitext(self.filename)[1] in ['.yml', '.yaml']:
                 with open(data, 'r', encoding='utf-8') as file:
@@ -77,8 +96,7 @@ class Byml:
                     self.version = 7
                     return
             elif os.path.splitext(self.filename)[1] in ['.byml', '.byaml', '.bgyml']:
-                with open(data, 'rb') as file:
-                    data = file.read()
+                data = load_file(data, use_mmap)
         else:
             self.filename = filename
 
@@ -98,57 +116,126 @@ class Byml:
         self.string_table_offset = self.stream.read_u32(self.bom) # String table of string values
         self.root_node_offset = self.stream.read_u32(self.bom) # Root node must be a hash array, array, or dictionary
 
+        self._buffer = self.stream.data if isinstance(self.stream.data, bytes) else memoryview(self.stream.data).cast("B")
+        self._u32, self._s32, self._u64, self._s64, self._f32, self._f64 = _DECODERS[self.bom]
+        # Container headers are a u8 type followed by a u24 count, dictionary entries a u24 key index then a u8 type
+        self._count_shift, self._key_shift = (8, 0) if self.bom == "<" else (0, 8)
+        self._array_decoders = _ARRAY_DECODERS[self.bom]
+        if share_nodes:
+            self.value_readers = self.shared_value_readers
+            self._shared = {} # Node offset -> decoded container
+
+        if lazy:
+            self.lazy = True
+            self.node_readers = self.lazy_node_readers
+            self.ParseLazy()
+            return
+
+        if pause_gc:
+            # The parse allocates a lot of objects and none of them can form cycles
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                self.Parse()
+            finally:
+                if gc_enabled:
+                    gc.enable()
+        else:
+            self.Parse()
+        if share_nodes:
+            self._shared = {} # Everything has been decoded, the memo is only needed by lazy trees
+
+    # Only the table headers and the root node's header are read, everything else is decoded on access
+    def ParseLazy(self):
+        self.key_table = LazyStringTable(self, self.key_table_offset) if self.key_table_offset else []
+        self.string_table = LazyStringTable(self, self.string_table_offset) if self.string_table_offset else []
+        self.root_node = self.ReadNode(self.root_node_offset) if self.root_node_offset else {}
+
+    # Converts a lazy tree into plain dicts and lists (and the tables into lists) so it can be edited and written
+    def Materialize(self):
+        if self.lazy:
+            self.root_node = materialize(self.root_node, {})
+            self.key_table = list(self.key_table)
+            self.string_table = list(self.string_table)
+            self.node_readers = Byml.node_readers
+            self.lazy = False
+        return self.root_node
+
+    # Replaces container[key] with a shallow copy so it can be edited without affecting other references to it
+    # (only needed with share_nodes), returns the copy
+    def Unshare(self, container, key):
+        node = container[key]
+        if isinstance(node, (list, dict)):
+            node = container[key] = node.copy()
+        return node
+
+    # Reads the key and string tables, then the root node
+    def Parse(self):
         if self.key_table_offset:
-            self.stream.seek(self.key_table_offset)
-            self.key_table = self.ParseNode()
+            self.key_table = self.ReadNode(self.key_table_offset)
         else:
             self.key_table = []
         if self.string_table_offset:
-            self.stream.seek(self.string_table_offset)
-            self.string_table = self.ParseNode()
+            self.string_table = self.ReadNode(self.string_table_offset)
         else:
             self.string_table = []
         if self.root_node_offset:
-            self.stream.seek(self.root_node_offset)
-            self.root_node = self.ParseNode()
+            self.root_node = self.ReadNode(self.root_node_offset)
         else:
             self.root_node = {}
 
     def ToYaml(self):
+        self.Materialize()
         dumper = yaml.Dumper
         add_representers(dumper)
         with open(self.filename + '.yml', 'w') as file:
             yaml.dump(self.root_node, file, sort_keys=False, allow_unicode=True, Dumper=dumper)
 
     def ToJson(self):
+        self.Materialize()
         with open(self.filename + '.json', 'w') as file:
             json.dump(self.root_node, file, indent=4)
 
     # lazy reserialization for now, hopefully will work on getting all node types for later
     def Reserialize(self, output_dir=''):
-        with open(os.path.join(output_dir, self.filename), 'wb+') as f:
-            buffer = WriteStream(f)
-            buffer.write(self.magic.encode())
-            buffer.write(u16(self.version, self.bom))
-            buffer.skip(12)
-            self.key_table, self.string_table = [], []
-            self.GenerateStringTables(self.root_node)
-            key_table_offset = buffer.tell()
-            self.key_table.sort()
-            self.WriteStringTable(self.key_table, buffer)
-            string_table_offset = buffer.tell()
-            self.string_table.sort()
-            self.WriteStringTable(self.string_table, buffer)
-            root_node_offset = buffer.tell()
-            nodes = {}
-            self.WriteNode(self.root_node, nodes, buffer)
-
-            buffer.seek(4)
-            buffer.write(u32(key_table_offset, self.bom))
-            buffer.write(u32(string_table_offset, self.bom))
-            buffer.write(u32(root_node_offset, self.bom))
-
-    def WriteNode(self, node, nodes, buffer):
+        with open(os.path.join(output_dir, self.filename), 'wb') as f:
+            f.write(self.ToBytes())
+
+    # Serializes into an in-memory buffer and returns the file contents
+    def ToBytes(self):
+        self.Materialize()
+        buffer = WriteStream()
+        buffer.write(self.magic.encode())
+        buffer.write(u16(self.version, self.bom))
+        buffer.skip(12)
+        self.key_table, self.string_table = [], []
+        self.GenerateStringTables(self.root_node)
+        key_table_offset = buffer.tell()
+        self.key_table.sort()
+        self.WriteStringTable(self.key_table, buffer)
+        string_table_offset = buffer.tell()
+        self.string_table.sort()
+        self.WriteStringTable(self.string_table, buffer)
+        # str -> index lookups for the node writer
+        self.key_indices = {key: i for i, key in enumerate(self.key_table)}
+        self.string_indices = {string: i for i, string in enumerate(self.string_table)}
+        root_node_offset = buffer.tell()
+        nodes = {}
+        self.node_hashes = {}
+        self.WriteNode(self.root_node, nodes, buffer, {})
+        self.node_hashes = {}
+
+        buffer.seek(4)
+        buffer.write(u32(key_table_offset, self.bom))
+        buffer.write(u32(string_table_offset, self.bom))
+        buffer.write(u32(root_node_offset, self.bom))
+        return buffer.getvalue()
+
+    # nodes maps (type, structural hash) -> [(node, address)] for deduplication, written maps id() -> address for
+    # containers already written so shared objects (share_nodes) are matched without comparing them
+    def WriteNode(self, node, nodes, buffer, written=None):
+        if written is None:
+            written = {}
         nonvalue_nodes = []
         
         if isinstance(node, list):
@@ -159,7 +246,7 @@ class Byml:
             buffer.align_up(4)
             for item in node:
                 if self.IsValue(item):
-                    buffer.write(self.FormatValue(item, self.string_table, self.bom))
+                    buffer.write(self.FormatValue(item, self.string_indices, self.bom))
                 else:
                     nonvalue_nodes.append((item, buffer.tell()))
                     buffer.write(u32(0))
@@ -169,10 +256,10 @@ class Byml:
             buffer.write(u24(len(node), self.bom))
             for key in sorted(node.keys()):
                 value = node[key]
-                buffer.write(u24(self.key_table.index(key), self.bom))
+                buffer.write(u24(self.key_indices[key], self.bom))
                 buffer.write(u8(self.GetNodeType(value)))
                 if self.IsValue(value):
-                    buffer.write(self.FormatValue(value, self.string_table, self.bom))
+                    buffer.write(self.FormatValue(value, self.string_indices, self.bom))
                 else:
                     nonvalue_nodes.append((value, buffer.tell()))
                     buffer.write(u32(0))
@@ -192,20 +279,22 @@ class Byml:
 
         for (data, offset) in nonvalue_nodes:
             node_data = data
-            data = (self.GetNodeType(data), self.FreezeObj(data))
-            if data in nodes:
-                pos = buffer.tell()
-                buffer.seek(offset)
-                buffer.write(u32(nodes[data], self.bom))
-                buffer.seek(pos)
+            if id(node_data) in written:
+                buffer.write_at_offset(u32(written[id(node_data)], self.bom), offset)
+                continue
+            key = (self.GetNodeType(node_data), self.HashNode(node_data, self.node_hashes))
+            candidates = nodes.setdefault(key, [])
+            # Equal hashes almost always mean equal subtrees, but it's confirmed before reusing an address
+            address = next((address for other, address in candidates if self.SameNode(node_data, other)), None)
+            if address is not None:
+                buffer.write_at_offset(u32(address, self.bom), offset)
             else:
-                pos = buffer.tell()
                 address = buffer.tell()
-                buffer.seek(offset)
-                buffer.write(u32(address, self.bom))
-                nodes[data] = address
-                buffer.seek(pos)
-                self.WriteNode(node_data, nodes, buffer)
+                buffer.write_at_offset(u32(address, self.bom), offset)
+                candidates.append((node_data, address))
+                self.WriteNode(node_data, nodes, buffer, written)
+            if isinstance(node_data, (list, dict)):
+                written[id(node_data)] = address
 
     def WriteStringTable(self, table, buffer):
         start = buffer.tell()
@@ -218,12 +307,132 @@ class Byml:
             buffer.write(entry.encode('utf-8') + b'\x00')
         end = buffer.tell()
         offsets.append(end - start)
-        buffer.seek(start + 4)
-        for offset in offsets:
-            buffer.write(u32(offset, self.bom))
-        buffer.seek(end)
+        buffer.write_at_offset(b''.join(u32(offset, self.bom) for offset in offsets), start + 4)
         buffer.align_up(4)
 
+    # Table-driven parser: nodes are decoded straight from the buffer at absolute offsets through the
+    # node_readers/value_readers dispatch tables (built below the class), nothing seeks the stream
+    # Node types the fast path doesn't cover fall back to the stream-based methods further down
+    def ReadNode(self, offset):
+        node_type = self._buffer[offset]
+        count = (self._u32(self._buffer, offset)[0] >> self._count_shift) & 0xffffff
+        return self.node_readers[node_type](self, offset, node_type, count)
+
+    # count values of a struct code at offset, decoded in one call
+    def UnpackAt(self, code, offset, count):
+        decoder = self._array_decoders.get((code, count))
+        if decoder is None:
+            decoder = struct.Struct(f"{self.bom}{count}{code}").unpack_from
+            if count <= 0x100:
+                self._array_decoders[(code, count)] = decoder
+        return decoder(self._buffer, offset)
+
+    def ReadNodeFallback(self, offset, node_type, count):
+        self.stream.seek(offset + 4)
+        return self.GetValue((node_type, count))
+
+    def ReadHashArray(self, offset, node_type, count):
+        buffer, u32, readers = self._buffer, self._u32, self.value_readers
+        hash_size = 4 * ((node_type & 0xf) + 1)
+        entry_size = hash_size + 4
+        pos = offset + 4
+        byteorder = "big" if self.magic == "BY" else "little"
+        entries = []
+        for value_type in bytes(buffer[pos + entry_size * count:pos + entry_size * count + count]):
+            hash = int.from_bytes(buffer[pos:pos + hash_size], byteorder)
+            entries.append({hex(hash): readers[value_type](self, u32(buffer, pos + hash_size)[0], pos + hash_size, value_type)})
+            pos += entry_size
+        return entries
+
+    def ReadArray(self, offset, node_type, count):
+        types = bytes(self._buffer[offset + 4:offset + 4 + count])
+        pos = (offset + 4 + count + 3) & ~3
+        if count and types.count(types[0]) == count and types[0] in self.inline_array_types:
+            return self.ReadInlineArrayAt(types[0], pos, count)
+        values, readers = self.UnpackAt("I", pos, count), self.value_readers
+        entries = []
+        for i, value_type in enumerate(types):
+            entries.append(readers[value_type](self, values[i], pos, value_type))
+            pos += 4
+        return entries
+
+    def ReadDictionary(self, offset, node_type, count):
+        words = self.UnpackAt("I", offset + 4, 2 * count)
+        buffer, key_table, key_shift, readers = self._buffer, self.key_table, self._key_shift, self.value_readers
+        entries = {}
+        pos = offset + 4
+        for i in range(0, 2 * count, 2):
+            # Each entry is a u24 key index and a u8 type (at +3 in both byte orders) followed by the value
+            value_type = buffer[pos + 3]
+            entries[key_table[(words[i] >> key_shift) & 0xffffff]] = readers[value_type](self, words[i + 1], pos + 4, value_type)
+            pos += 8
+        return entries
+
+    def ReadStringTable(self, offset, node_type, count):
+        return [self.stream.string_at(offset + string_offset) for string_offset in self.UnpackAt("I", offset + 4, count)]
+
+    def ReadInlineArrayAt(self, node_type, offset, count):
+        kind, constructor = self.inline_array_types[node_type]
+        values = self.UnpackAt(ARRAY_KINDS[kind][0], offset, count)
+        if constructor is None:
+            string_table = self.string_table
+            return [string_table[i] for i in values]
+        return list(map(constructor, values))
+
+    # Value readers decode an array/dictionary entry from its raw u32 (value or offset) and position,
+    # same semantics as GetArrayValue
+    def ReadChildNode(self, value, pos, node_type):
+        buffer = self._buffer
+        return self.node_readers[buffer[value]](self, value, buffer[value], (self._u32(buffer, value)[0] >> self._count_shift) & 0xffffff)
+
+    def ReadStringIndexValue(self, value, pos, node_type):
+        return self.string_table[value]
+
+    def ReadBinaryValue(self, value, pos, node_type):
+        size = self._u32(self._buffer, value)[0]
+        return bytes(self._buffer[value + 4:value + 4 + size])
+
+    def ReadBoolValue(self, value, pos, node_type):
+        return bool(value)
+
+    def ReadIntValue(self, value, pos, node_type):
+        return Int(value - ((value & 0x80000000) << 1))
+
+    def ReadFloatValue(self, value, pos, node_type):
+        return Float(self._f32(self._buffer, pos)[0])
+
+    def ReadUIntValue(self, value, pos, node_type):
+        return UInt(value)
+
+    def ReadLongValue(self, value, pos, node_type):
+        return Long(self._s64(self._buffer, value)[0])
+
+    def ReadULongValue(self, value, pos, node_type):
+        return ULong(self._u64(self._buffer, value)[0])
+
+    def ReadDoubleValue(self, value, pos, node_type):
+        return Double(self._f64(self._buffer, value)[0])
+
+    def ReadLazyArray(self, offset, node_type, count):
+        return LazyArray(self, offset, count)
+
+    def ReadLazyDictionary(self, offset, node_type, count):
+        return LazyDictionary(self, offset, count)
+
+    # Containers at an offset that was already decoded are shared instead of decoded again
+    def ReadSharedChildNode(self, value, pos, node_type):
+        node = self._shared.get(value)
+        if node is None:
+            node = self._shared[value] = self.ReadChildNode(value, pos, node_type)
+        return node
+
+    def ReadNullValue(self, value, pos, node_type):
+        return None
+
+    def ReadValueFallback(self, value, pos, node_type):
+        self.stream.seek(pos)
+        return self.GetArrayValue((node_type, 1))
+
     def ParseNode(self):
         node_info = self.GetContainerInfo()
         return self.GetValue(node_info)
@@ -317,16 +526,14 @@ class Byml:
     def BinaryDataWithAlignment(self, node_info):
         size = self.stream.read_u32(self.bom)
         align = self.stream.read_u32(self.bom)
-        while self.stream.tell() % align != 0:
-            self.stream.read(1)
+        self.stream.align_up(align)
         return self.stream.read(size)
 
     def Array(self, node_info):
-        types = []
-        for i in range(node_info[1]):
-            types.append(self.stream.read_u8())
-        while self.stream.tell() % 4 != 0:
-            self.stream.read(1)
+        types = self.stream.read_array("u8", node_info[1], use_numpy=False)
+        self.stream.align_up(4)
+        if node_info[1] and types.count(types[0]) == node_info[1] and types[0] in self.inline_array_types:
+            return self.ReadInlineArray(types[0], node_info[1])
         entries = []
         for i in range(node_info[1]):
             entries.append(self.GetArrayValue((types[i], 1)))
@@ -342,14 +549,8 @@ class Byml:
 
     def StringTable(self, node_info):
         base_offsets = self.stream.tell() - 4
-        offsets = []
-        for i in range(node_info[1]):
-            offsets.append(self.stream.read_u32(self.bom))
-        strings = []
-        for i in range(node_info[1]):
-            self.stream.seek(base_offsets + offsets[i])
-            strings.append(self.stream.read_string_sarc())
-        return strings
+        offsets = self.stream.read_array("u32", node_info[1], self.bom).tolist()
+        return [self.stream.string_at(base_offsets + offset) for offset in offsets]
 
     # Unsupported
     def DictionaryWithRemap(self, node_info):
@@ -362,23 +563,50 @@ class Byml:
     def MonoTypedArray(self, node_info):
         array_type = self.stream.read_u8()
         self.stream.read(3)
+        if array_type in self.inline_array_types:
+            return self.ReadInlineArray(array_type, node_info[1])
         entries = []
         for i in range(node_info[1]):
             entries.append(self.GetArrayValue((array_type, 1)))
         return entries
     
+    # Inline value types that can be read as one typed array -> (element kind, constructor)
+    inline_array_types = {
+        0xa0: ("u32", None), # StringIndex, resolved against the string table
+        0xd0: ("u32", bool),
+        0xd1: ("s32", Int),
+        0xd2: ("f32", Float),
+        0xd3: ("u32", UInt),
+    }
+
+    def ReadInlineArray(self, node_type, count):
+        kind, constructor = self.inline_array_types[node_type]
+        values = self.stream.read_array(kind, count, self.bom).tolist()
+        if constructor is None:
+            return [self.string_table[i] for i in values]
+        return list(map(constructor, values))
+
     # essentially pulled from byml library
+    # Adds every key and string value under data to the (unsorted) tables, membership is tracked with dicts
     def GenerateStringTables(self, data):
-        if type(data) == str and data not in self.string_table:
-            self.string_table.append(data)
-        elif type(data) == list:
-            for item in data:
-                self.GenerateStringTables(item)
-        elif type(data) == dict:
-            for k in data:
-                if k not in self.key_table:
-                    self.key_table.append(k)
-                self.GenerateStringTables(data[k])
+        keys, strings = dict.fromkeys(self.key_table), dict.fromkeys(self.string_table)
+        self.CollectStrings(data, keys, strings, set())
+        self.key_table, self.string_table = list(keys), list(strings)
+
+    def CollectStrings(self, data, keys, strings, visited):
+        if type(data) == str:
+            strings[data] = None
+        elif type(data) in (list, dict):
+            if id(data) in visited: # Shared subtree, already collected
+                return
+            visited.add(id(data))
+            if type(data) == list:
+                for item in data:
+                    self.CollectStrings(item, keys, strings, visited)
+            else:
+                for k in data:
+                    keys[k] = None
+                    self.CollectStrings(data[k], keys, strings, visited)
 
     # from the byml library for now, should probably expand for all node types eventually
     @staticmethod
@@ -415,10 +643,11 @@ class Byml:
             return True
         return False
     
+    # string_table can be the table itself or a str -> index dict
     @staticmethod
     def FormatValue(data, string_table, bom):
         if isinstance(data, str):
-            return u32(string_table.index(data), bom)
+            return u32(string_table[data] if isinstance(string_table, dict) else string_table.index(data), bom)
         if isinstance(data, bool):
             return u32(1 if data else 0, bom)
         if isinstance(data, Int):
@@ -431,6 +660,40 @@ class Byml:
             return u32(0, bom)
         raise ValueError(f"Invalid value type: {type(data)}")
     
+    # Bottom-up (Merkle-style) structural hash, a container's hash combines its children's hashes
+    # Containers are hashed once and memoized by id() in hashes, so the whole tree takes a single post-order pass
+    # Leaves are compared the way FreezeObj does (type and str(), which e.g. keeps 0.0 and -0.0 apart)
+    def HashNode(self, node, hashes):
+        if isinstance(node, dict):
+            node_hash = hashes.get(id(node))
+            if node_hash is None:
+                node_hash = hashes[id(node)] = builtins.hash((0xC1,) + tuple((key, self.HashNode(node[key], hashes)) for key in sorted(node)))
+            return node_hash
+        if isinstance(node, list):
+            node_hash = hashes.get(id(node))
+            if node_hash is None:
+                node_hash = hashes[id(node)] = builtins.hash((0xC0,) + tuple(self.HashNode(item, hashes) for item in node))
+            return node_hash
+        if isinstance(node, float):
+            return builtins.hash((type(node), str(node)))
+        try:
+            return builtins.hash((type(node), node))
+        except TypeError:
+            return builtins.hash((type(node), str(node)))
+
+    # Whether two subtrees are the same as far as FreezeObj is concerned
+    @staticmethod
+    def SameNode(a, b):
+        if a is b:
+            return True
+        if isinstance(a, dict):
+            return isinstance(b, dict) and a.keys() == b.keys() and all(Byml.SameNode(a[key], b[key]) for key in a)
+        if isinstance(a, list):
+            return isinstance(b, list) and len(a) == len(b) and all(map(Byml.SameNode, a, b))
+        if isinstance(b, (dict, list)) or type(a) is not type(b):
+            return False
+        return str(a) == str(b) if isinstance(a, float) else a == b
+
     @staticmethod
     def FreezeObj(o):
         def Freeze(o):
@@ -440,6 +703,192 @@ class Byml:
                 return tuple([Freeze(i) for i in o])
             return str(o) + str(type(o))
         return Freeze(o)
+
+# Dispatch tables for the table-driven parser, indexed by node type
+Byml.node_readers = [Byml.ReadNodeFallback] * 256
+for node_type in range(0x20, 0x30):
+    Byml.node_readers[node_type] = Byml.ReadHashArray
+Byml.node_readers[0xc0] = Byml.ReadArray
+Byml.node_readers[0xc1] = Byml.ReadDictionary
+Byml.node_readers[0xc2] = Byml.ReadStringTable
+
+Byml.value_readers = [Byml.ReadValueFallback] * 256
+for node_type in list(range(0xa0)) + [0xc0, 0xc1, 0xc4, 0xc8]:
+    Byml.value_readers[node_type] = Byml.ReadChildNode
+Byml.value_readers[0xa0] = Byml.ReadStringIndexValue
+Byml.value_readers[0xa1] = Byml.ReadBinaryValue
+Byml.value_readers[0xd0] = Byml.ReadBoolValue
+Byml.value_readers[0xd1] = Byml.ReadIntValue
+Byml.value_readers[0xd2] = Byml.ReadFloatValue
+Byml.value_readers[0xd3] = Byml.ReadUIntValue
+Byml.value_readers[0xd4] = Byml.ReadLongValue
+Byml.value_readers[0xd5] = Byml.ReadULongValue
+Byml.value_readers[0xd6] = Byml.ReadDoubleValue
+Byml.value_readers[0xff] = Byml.ReadNullValue
+del node_type
+
+# With share_nodes, child containers go through the offset memo
+Byml.shared_value_readers = [Byml.ReadSharedChildNode if reader is Byml.ReadChildNode else reader for reader in Byml.value_readers]
+
+# Lazy mode decodes containers into proxies, everything else is read the same way
+Byml.lazy_node_readers = list(Byml.node_readers)
+Byml.lazy_node_readers[0xc0] = Byml.ReadLazyArray
+Byml.lazy_node_readers[0xc1] = Byml.ReadLazyDictionary
+
+# Read-only list view of a string table node, strings are decoded on access
+class LazyStringTable(Sequence):
+    def __init__(self, byml, offset):
+        self._byml = byml
+        self._offset = offset
+        self._count = (byml._u32(byml._buffer, offset)[0] >> byml._count_shift) & 0xffffff
+        self._strings = {}
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("string table index out of range")
+        string = self._strings.get(index)
+        if string is None:
+            byml = self._byml
+            string_offset = byml._u32(byml._buffer, self._offset + 4 + 4 * index)[0]
+            string = self._strings[index] = byml.stream.string_at(self._offset + string_offset)
+        return string
+
+    # String tables are sorted (str order matches the UTF-8 byte order used by the format) so this is a binary search
+    def index(self, value, start=0, stop=None):
+        index = bisect_left(self, value, start, self._count if stop is None else stop)
+        if index < self._count and self[index] == value:
+            return index
+        raise ValueError(f"{value!r} is not in the string table")
+
+    def __contains__(self, value):
+        try:
+            self.index(value)
+        except ValueError:
+            return False
+        return True
+
+# Read-only view of a dictionary node, keys are found by binary search and values decoded on first access
+class LazyDictionary(Mapping):
+    def __init__(self, byml, offset, count):
+        self._byml = byml
+        self._offset = offset
+        self._count = count
+        self._values = {}
+
+    def __len__(self):
+        return self._count
+
+    def _KeyIndex(self, entry):
+        byml = self._byml
+        return (byml._u32(byml._buffer, self._offset + 4 + 8 * entry)[0] >> byml._key_shift) & 0xffffff
+
+    def _Value(self, entry):
+        if entry in self._values:
+            return self._values[entry]
+        byml = self._byml
+        pos = self._offset + 8 + 8 * entry
+        value_type = byml._buffer[pos - 1]
+        value = self._values[entry] = byml.value_readers[value_type](byml, byml._u32(byml._buffer, pos)[0], pos, value_type)
+        return value
+
+    # Entries are sorted by key, and the key table is sorted, so entries are sorted by key index
+    def _Find(self, key):
+        try:
+            key_index = self._byml.key_table.index(key)
+        except ValueError:
+            return -1
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._KeyIndex(mid) < key_index:
+                low = mid + 1
+            else:
+                high = mid
+        return low if low < self._count and self._KeyIndex(low) == key_index else -1
+
+    def __getitem__(self, key):
+        entry = self._Find(key) if isinstance(key, str) else -1
+        if entry == -1:
+            raise KeyError(key)
+        return self._Value(entry)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self._Find(key) != -1
+
+    def __iter__(self):
+        key_table = self._byml.key_table
+        for entry in range(self._count):
+            yield key_table[self._KeyIndex(entry)]
+
+    def items(self):
+        return [(key, self._Value(entry)) for entry, key in enumerate(self)]
+
+    def values(self):
+        return [self._Value(entry) for entry in range(self._count)]
+
+    def __repr__(self):
+        return f"LazyDictionary({len(self)} entries at {hex(self._offset)})"
+
+    def Materialize(self):
+        return materialize(self, {})
+
+# Read-only view of an array node, elements are decoded on first access
+class LazyArray(Sequence):
+    def __init__(self, byml, offset, count):
+        self._byml = byml
+        self._offset = offset
+        self._count = count
+        self._values = {}
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("array index out of range")
+        if index in self._values:
+            return self._values[index]
+        byml = self._byml
+        value_type = byml._buffer[self._offset + 4 + index]
+        pos = ((self._offset + 4 + self._count + 3) & ~3) + 4 * index
+        value = self._values[index] = byml.value_readers[value_type](byml, byml._u32(byml._buffer, pos)[0], pos, value_type)
+        return value
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyArray)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"LazyArray({len(self)} elements at {hex(self._offset)})"
+
+    def Materialize(self):
+        return materialize(self, {})
+
+# Recursively converts lazy proxies into plain dicts and lists, memo (id -> converted) keeps shared nodes shared
+def materialize(node, memo=None):
+    if not isinstance(node, (LazyDictionary, LazyArray, dict, list)): # Dicts and lists can hold proxies (hash arrays)
+        return node
+    if memo is not None and id(node) in memo:
+        return memo[id(node)]
+    if isinstance(node, (LazyDictionary, dict)):
+        converted = {key: materialize(value, memo) for key, value in node.items()}
+    else:
+        converted = [materialize(value, memo) for value in node]
+    if memo is not None:
+        memo[id(node)] = converted
+    return converted
     
 def ExtractPtcl(path_to_esetb):
     filepath = path_to_esetb
@@ -1,13 +1,10 @@
 import byml
 import zstd
+import hashing
 import os
 import json
 import math
 from pathlib import Path
-try:
-    import mmh3
-except ImportError:
-    raise ImportError("mmh3 not found - try running pip install mmh3 then try again")
 
 valid_types = [
     "Bool",
@@ -63,14 +60,20 @@ reset_types = [
 letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
 
 class GameData:
-    def __init__(self, gamedata_path, romfs_path=""):
+    # cache_dir enables a decompression cache so later runs map GameDataList instead of decompressing it again
+    # The cache is only passed to this decompress() call, the context itself is left without one
+    def __init__(self, gamedata_path, romfs_path="", cache_dir=""):
         print("Initializing GameData")
         try:
             self._ctx = zstd.ZstdDecompContext(os.path.join(romfs_path, "Pack/ZsDic.pack.zs"))
         except:
             raise Exception("Error initializing Zstd decompression context")
         try:
-            self._byml = byml.Byml(self._ctx.decompress(gamedata_path), os.path.basename(gamedata_path).replace(".zs", ""))
+            self._cache = zstd.DecompressionCache(cache_dir) if cache_dir else None
+        except Exception as e:
+            raise Exception(f"Error initializing decompression cache in {cache_dir}") from e
+        try:
+            self._byml = byml.Byml(self._ctx.decompress(gamedata_path, cache=self._cache), os.path.basename(gamedata_path).replace(".zs", ""))
         except:
             raise Exception("Error reading GameDataList file")
         with open("hashes.json", "r", encoding="utf-8") as f:
@@ -89,7 +92,7 @@ class GameData:
         return None
     
     def GetFlagByName(self, flagname, datatype):
-        hash = mmh3.hash(flagname, signed=False)
+        hash = hashing.hash_name(flagname)
         return self.GetFlagByHash(hash, datatype)
     
     def AddFlag(self, new_flag, datatype, validate=True):
@@ -118,7 +121,7 @@ class GameData:
         return 0
     
     def DeleteFlagByName(self, flagname, datatype):
-        hash = mmh3.hash(flagname, signed=False)
+        hash = hashing.hash_name(flagname)
         return self.DeleteFlagByHash(hash, datatype)
     
     def Serialize(self, output_dir=""):
@@ -176,9 +179,15 @@ class GameData:
         return None
     
     def RegisterNewHash(self, flagname):
-        hash = "%08x" % mmh3.hash(flagname, signed=False)
+        hash = "%08x" % hashing.hash_name(flagname)
         if hash not in self._hashes:
             self._hashes[hash] = flagname
+
+    def RegisterNewHashes(self, flagnames):
+        for hash, flagname in hashing.hash_names(flagnames)[1].items():
+            hash = "%08x" % hash
+            if hash not in self._hashes:
+                self._hashes[hash] = flagname
     
     @staticmethod
     def GetSize(datatype, entry):
@@ -0,0 +1,28 @@
+# Shared murmur3 hashing for flag names
+from array import array
+from functools import lru_cache
+from typing import Dict, Iterable, Tuple
+try:
+    import mmh3
+except ImportError:
+    raise ImportError("mmh3 not found, try running pip install mmh3 then try again")
+
+# Number of names kept in the memo, enough for every flag in GameDataList with room to spare
+CACHE_SIZE: int = 0x40000
+
+# Unsigned 32-bit murmur3 hash of a flag name, memoized
+@lru_cache(maxsize=CACHE_SIZE)
+def hash_name(name: str) -> int:
+    return mmh3.hash(name, signed=False)
+
+# Hashes every name into a compact array('I'), also returns a hash -> name mapping for reverse lookups
+def hash_names(names: Iterable[str]) -> Tuple[array, Dict[int, str]]:
+    names = list(names)
+    hashes: array = array("I", map(hash_name, names))
+    return hashes, dict(zip(hashes, names))
+
+def cache_info():
+    return hash_name.cache_info()
+
+def clear_cache() -> None:
+    hash_name.cache_clear()
@@ -0,0 +1,132 @@
+# Romfs-wide index of which pack contains which file
+from typing import Dict, List, NamedTuple, Tuple
+import concurrent.futures
+import json
+import os
+import struct
+import zstd
+import sarc
+from utils import map_file
+
+# Bump when the on-disk layout changes, older index files are rebuilt from scratch
+INDEX_VERSION: int = 1
+
+class PackEntry(NamedTuple):
+    pack: str # Pack path relative to the romfs
+    offset: int # Offset of the file in the decompressed pack
+    size: int
+    hash: int # SARC name hash from the SFAT
+
+class PackIndex:
+    # Indexes every Pack/**/*.pack(.zs) under romfs_path, index_path is where the index is persisted (optional)
+    # Only packs that are new or whose mtime/size changed since the index was saved are read again
+    def __init__(self, romfs_path: str, index_path: str="", ctx: zstd.ZstdDecompContext=None, workers: int=None) -> None:
+        self.romfs_path: str = romfs_path
+        self.index_path: str = index_path
+        self.ctx: zstd.ZstdDecompContext = ctx or zstd.ZstdDecompContext(os.path.join(romfs_path, "Pack/ZsDic.pack.zs"))
+        self.packs: Dict[str, Tuple[int, int, List[list]]] = {} # Pack -> (mtime_ns, size, [[name, offset, size, hash], ...])
+        self.files: Dict[str, List[PackEntry]] = {}
+        self._open: Tuple[str, bytes] = ("", b"")
+        if index_path and os.path.isfile(index_path):
+            self.load()
+        self.update(workers)
+
+    def load(self) -> None:
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            index: dict = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            self.packs = {pack: tuple(info) for pack, info in index["packs"].items()}
+        self._build_lookup()
+
+    def save(self, index_path: str="") -> None:
+        index_path = index_path or self.index_path
+        temp_path: str = index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "packs": self.packs}, f, separators=(",", ":"))
+        os.replace(temp_path, index_path)
+
+    # Rescans the romfs, reindexing stale packs in parallel and dropping deleted ones
+    # Returns the list of packs that were (re)indexed
+    def update(self, workers: int=None) -> List[str]:
+        current: Dict[str, Tuple[int, int]] = {}
+        pack_dir: str = os.path.join(self.romfs_path, "Pack")
+        for root_dir, dirs, files in os.walk(pack_dir):
+            for file in files:
+                if not (file.endswith(".pack.zs") or file.endswith(".pack")) or file == "ZsDic.pack.zs":
+                    continue
+                path: str = os.path.join(root_dir, file)
+                stat: os.stat_result = os.stat(path)
+                current[os.path.relpath(path, self.romfs_path).replace(os.sep, "/")] = (stat.st_mtime_ns, stat.st_size)
+        stale: List[str] = [pack for pack, key in current.items() if self.packs.get(pack, (None, None))[:2] != key]
+        removed: List[str] = [pack for pack in self.packs if pack not in current]
+        for pack in removed:
+            del self.packs[pack]
+        if stale:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                for pack, files in zip(stale, executor.map(self._read_pack, stale)):
+                    self.packs[pack] = (*current[pack], files)
+        if stale or removed:
+            self._build_lookup()
+            if self.index_path:
+                self.save()
+        return stale
+
+    def _read_pack(self, pack: str) -> List[list]:
+        archive: sarc.Sarc = read_pack_tables(os.path.join(self.romfs_path, pack), self.ctx)
+        files: List[list] = []
+        for i in range(archive.file_count):
+            hash, start, end = archive.GetNode(i)
+            files.append([archive.GetName(i), archive.data_offset + start, end - start, hash])
+        return files
+
+    def _build_lookup(self) -> None:
+        self.files = {}
+        for pack in sorted(self.packs):
+            for name, offset, size, hash in self.packs[pack][2]:
+                self.files.setdefault(name, []).append(PackEntry(pack, offset, size, hash))
+
+    # First pack (in path order) containing the file, raises KeyError if no pack has it
+    def lookup(self, name: str) -> PackEntry:
+        return self.files[name][0]
+
+    # Every pack containing the file
+    def lookup_all(self, name: str) -> List[PackEntry]:
+        return self.files.get(name, [])
+
+    # Zero-copy view of a file's data, only the pack holding it is opened (and decompressed)
+    # The last opened pack is kept so reading several files from the same pack only opens it once
+    def read(self, name: str, entry: PackEntry=None) -> memoryview:
+        entry = entry or self.lookup(name)
+        if self._open[0] != entry.pack:
+            path: str = os.path.join(self.romfs_path, entry.pack)
+            self._open = (entry.pack, self.ctx.decompress(path) if path.endswith(".zs") else map_file(path))
+        return memoryview(self._open[1])[entry.offset:entry.offset + entry.size]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.files
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+# Reads only the header, SFAT and SFNT of a pack into a lazy Sarc, the data section is never decompressed
+def read_pack_tables(path: str, ctx: zstd.ZstdDecompContext) -> sarc.Sarc:
+    with open(path, "rb") as f:
+        if path.endswith(".zs"):
+            decompressor = ctx.get_thread_decompressor(f.read(zstd.FRAME_HEADER_MAX_SIZE))
+            f.seek(0)
+            with decompressor.stream_reader(f, closefd=False) as reader:
+                header: bytes = _read_exact(reader, 0x14)
+                data_offset: int = struct.unpack_from("<I" if header[6:8] == b"\xFF\xFE" else ">I", header, 0xc)[0]
+                header += _read_exact(reader, data_offset - 0x14)
+        else:
+            header = map_file(path)
+    return sarc.Sarc(header, os.path.basename(path), lazy=True)
+
+def _read_exact(reader, size: int) -> bytes:
+    data: bytes = reader.read(size)
+    while len(data) < size:
+        chunk: bytes = reader.read(size - len(data))
+        if not chunk:
+            raise ValueError("Unexpected end of pack while reading the SARC header")
+        data += chunk
+    return data
@@ -0,0 +1,75 @@
+# Resource size table (RESTBL) sizing for a whole romfs or mod
+from typing import Dict, List
+import concurrent.futures
+import os
+import zstd
+import zstandard
+import packindex
+
+# Per-process decompression context for pool workers
+_worker_ctx: zstd.ZstdDecompContext = None
+
+def _init_worker(zsdic_pack_path: str) -> None:
+    global _worker_ctx
+    _worker_ctx = zstd.ZstdDecompContext(zsdic_pack_path)
+
+# Sizes of every file in a pack, straight from the SFAT start/end offsets
+def _pack_sizes(path: str) -> Dict[str, int]:
+    archive = packindex.read_pack_tables(path, _worker_ctx)
+    sizes: Dict[str, int] = {}
+    for i in range(archive.file_count):
+        hash, start, end = archive.GetNode(i)
+        sizes[archive.GetName(i)] = end - start
+    return sizes
+
+# Decompressed size of a loose .zs file from its frame header, only decompressed (and counted) if the
+# frame doesn't record its content size
+def get_zs_size(path: str, ctx: zstd.ZstdDecompContext) -> int:
+    with open(path, "rb") as f:
+        header: bytes = f.read(zstd.FRAME_HEADER_MAX_SIZE)
+        content_size: int = zstandard.get_frame_parameters(header).content_size
+        if content_size != zstandard.CONTENTSIZE_UNKNOWN:
+            return content_size
+        f.seek(0)
+        return _count_decompressed(f, ctx, header)
+
+def _count_decompressed(f, ctx: zstd.ZstdDecompContext, header: bytes) -> int:
+    size: int = 0
+    with ctx.get_thread_decompressor(header).stream_reader(f, closefd=False) as reader:
+        while True:
+            chunk: bytes = reader.read(zstd.STREAM_CHUNK_SIZE)
+            if not chunk:
+                return size
+            size += len(chunk)
+
+# Builds a name -> decompressed size table for every resource under root (a romfs or a mod's romfs folder)
+# Loose files are named by their path relative to root without .zs, files inside packs by their name in the pack
+# Pack tables are read in a process pool, sizes come from the SFAT so file data is never decompressed
+# Names found more than once (e.g. in several packs) keep their largest size
+def get_size_table(root: str, zsdic_pack_path: str="", workers: int=None) -> Dict[str, int]:
+    zsdic_pack_path = zsdic_pack_path or os.path.join(root, "Pack/ZsDic.pack.zs")
+    ctx: zstd.ZstdDecompContext = zstd.ZstdDecompContext(zsdic_pack_path)
+    sizes: Dict[str, int] = {}
+    packs: List[str] = []
+    for root_dir, dirs, files in os.walk(root):
+        for file in files:
+            path: str = os.path.join(root_dir, file)
+            name: str = os.path.relpath(path, root).replace(os.sep, "/")
+            if name.endswith(".zs"):
+                name, size = name[:-3], get_zs_size(path, ctx)
+            else:
+                size = os.path.getsize(path)
+            _merge(sizes, name, size)
+            if name.endswith(".pack") and file != "ZsDic.pack.zs":
+                packs.append(path)
+    if packs:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=(zsdic_pack_path,)) as executor:
+            for pack_sizes in executor.map(_pack_sizes, packs, chunksize=max(1, len(packs) // (4 * (workers or os.cpu_count() or 1)))):
+                for name, size in pack_sizes.items():
+                    _merge(sizes, name, size)
+    return sizes
+
+def _merge(sizes: Dict[str, int], name: str, size: int) -> None:
+    if size > sizes.get(name, -1):
+        sizes[name] = size
@@ -1,12 +1,26 @@
 from utils import *
 import os
 import io
+import fnmatch
+import contextlib
+import mmap
+import shutil
+import struct
+import operator
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
 
 class Sarc:
-    # Takes a SARC file, directory, or raw bytes as input
+    # Takes a SARC file, directory, or raw bytes (any buffer) as input
     # If using raw bytes, please provide a filename
-    def __init__(self, data, filename=''):
-        if type(data) != bytes:
+    # With use_mmap, SARC files are memory-mapped and file data is returned as memoryview slices into the map
+    # With lazy, only the SFAT/SFNT tables are parsed - files are looked up by name with archive[name] and returned
+    # as memoryview slices, self.files is only built if it's accessed
+    def __init__(self, data, filename='', use_mmap=False, lazy=False):
+        self._files = None
+        if isinstance(data, (str, os.PathLike)):
             self.filename = os.path.basename(data)
             # Convert directory into Sarc object
             if os.path.isdir(data):
@@ -31,8 +45,7 @@ class Sarc:
                         self.files.append(file_data)
                 return
             elif os.path.isfile(data):
-                with open(data, 'rb') as file:
-                    data = file.read()
+                data = load_file(data, use_mmap)
         else:
             self.filename = filename
         self.stream = ReadStream(data)
@@ -54,7 +67,7 @@ class Sarc:
         self.stream.read(2)
 
         self.stream.seek(self.data_offset)
-        self.data = self.stream.read()
+        self.data = self.stream.read_view()
         self.stream.seek(self.header_size)
 
         # SFAT Header
@@ -68,16 +81,9 @@ class Sarc:
         self.hash_mult = self.stream.read_u32(self.bom)
         assert self.hash_mult == 101, f"Hash multiplier in official files must be 101, got {self.hash_mult}"
 
-        nodes = []
-        for i in range(self.file_count):
-            node = {}
-            node["Hash"] = self.stream.read_u32(self.bom)
-            name_and_flags = self.stream.read_u32(self.bom)
-            node["Collision Flag"] = name_and_flags >> 24
-            node["Filename Offset"] = (name_and_flags & 0xffffff) * 4 # Offset is divided by 4
-            node["Data Start"] = self.stream.read_u32(self.bom)
-            node["Data End"] = self.stream.read_u32(self.bom)
-            nodes.append(node)
+        # SFAT nodes are (hash, collision flag << 24 | name offset / 4, data start, data end), sorted by hash
+        self._nodes = self.stream.read_array("u32", 4 * self.file_count, self.bom, use_numpy=False)
+        self._hashes = self._nodes[0::4]
         
         if self.data_offset < self.stream.tell():
             raise ValueError("Data section must come after SFNT section")
@@ -90,106 +96,226 @@ class Sarc:
         self.stream.read(2)
 
         self.name_table_offset = self.stream.tell()
+        self._names = {} # Name table offset -> decoded name
 
-        self.files = []
-        for node in nodes:
-            file = {}
-            pos = self.stream.tell()
-            self.stream.seek(self.name_table_offset + node["Filename Offset"])
-            file["Name"] = get_string(self.stream, 0)
-            file["Data"] = self.data[node["Data Start"]:node["Data End"]]
-            self.stream.seek(pos)
-            self.files.append(file)
-        
         self.stream.seek(0, io.SEEK_END)
         self.size = self.stream.tell()
 
+        if not lazy:
+            self.LoadFiles()
+
+    @property
+    def files(self):
+        if self._files is None:
+            self.LoadFiles()
+        return self._files
+
+    @files.setter
+    def files(self, files):
+        self._files = files
+
+    # Builds self.files from the SFAT, file data is copied unless the archive is memory-mapped
+    def LoadFiles(self):
+        self._files = []
+        for i in range(self.file_count):
+            file = {}
+            file["Name"] = self.GetName(i)
+            file["Data"] = self.GetData(i)
+            if not self.stream.mapped:
+                file["Data"] = bytes(file["Data"])
+            self._files.append(file)
+
+    # Name of the i-th SFAT node
+    def GetName(self, index):
+        name_offset = (self._nodes[4 * index + 1] & 0xffffff) * 4 # Offset is divided by 4
+        return self.stream.string_at(self.name_table_offset + name_offset, self._names)
+
+    # Zero-copy view of the i-th SFAT node's data
+    def GetData(self, index):
+        return self.data[self._nodes[4 * index + 2]:self._nodes[4 * index + 3]]
+
+    # Hash and data start/end (relative to the data section) of the i-th SFAT node
+    def GetNode(self, index):
+        return self._nodes[4 * index], self._nodes[4 * index + 2], self._nodes[4 * index + 3]
+
+    # Binary searches the hash-sorted SFAT for a file, returns its node index or -1
+    def FindFile(self, filename):
+        hash = self.Hash(filename)
+        index = bisect_left(self._hashes, hash)
+        while index < self.file_count and self._hashes[index] == hash:
+            if self.GetName(index) == filename:
+                return index
+            index += 1
+        return -1
+
+    # Looks files up through the SFAT until self.files has been built (and possibly edited), then through self.files
+    def __getitem__(self, filename):
+        if self._files is None:
+            index = self.FindFile(filename)
+            if index == -1:
+                raise KeyError(filename)
+            return self.GetData(index)
+        for file in self._files:
+            if file["Name"] == filename:
+                return file["Data"]
+        raise KeyError(filename)
+
+    def __contains__(self, filename):
+        try:
+            self[filename]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return self.file_count if self._files is None else len(self._files)
+
     # Converts SARC into directory
-    def ExtractArchive(self, dirname=''):
+    # filter can be a glob pattern or a callable taking the file name, only matching files are extracted
+    # (in lazy mode the other files are never read). Files are written from a pool of workers threads
+    def ExtractArchive(self, dirname='', filter=None, workers=None):
         dirname = os.path.join(dirname, os.path.splitext(self.filename)[0])
-        if not(os.path.exists(dirname)):
-            os.makedirs(dirname)
-        for file in self.files:
-            if not(os.path.exists(os.path.join(dirname, os.path.dirname(file["Name"])))):
-                os.makedirs(os.path.join(dirname, os.path.dirname(file["Name"])))
-            with open(os.path.join(dirname, file["Name"]), 'wb') as outfile:
-                outfile.write(file["Data"])
+        if isinstance(filter, str):
+            pattern = filter
+            filter = lambda name: fnmatch.fnmatchcase(name, pattern)
+        files = []
+        if self._files is None:
+            for i in range(self.file_count):
+                name = self.GetName(i)
+                if filter is None or filter(name):
+                    files.append((os.path.join(dirname, name), self.GetData(i)))
+        else:
+            for file in self._files:
+                if filter is None or filter(file["Name"]):
+                    files.append((os.path.join(dirname, file["Name"]), file["Data"]))
+        # Every directory is created once up front so the writers don't have to check
+        for dir_path in sorted({os.path.dirname(path) for path, data in files} | {dirname}):
+            os.makedirs(dir_path, exist_ok=True)
+        if workers == 1 or len(files) < 2:
+            for path, data in files:
+                _write_file(path, data)
+        else:
+            with ThreadPoolExecutor(workers) as executor:
+                for future in [executor.submit(_write_file, path, data) for path, data in files]:
+                    future.result()
 
     # Filename hash algorithm
     def Hash(self, filename):
-        hash = 0
-        if type(filename) != bytes:
-            filename = bytearray(filename.encode('utf-8'))
-        if type(filename) != bytearray:
-            filename = bytearray(filename)
-        for byte in filename:
-            hash = hash * self.hash_mult + byte
-        return hash & 0xFFFFFFFF
+        return sarc_hash(filename, self.hash_mult)
+
+    # Hashes a list of names in one call
+    def Hashes(self, filenames):
+        return sarc_hashes(filenames, self.hash_mult)
     
     # Creates SARC file
     def CreateArchive(self, filename='', output_dir='', endianness="little"):
-        if endianness.lower() == "little":
-            bom = "<"
-        else:
-            bom = ">"
         if filename == '':
             filename = self.filename
-        with open(os.path.join(output_dir, filename), 'wb+') as outfile:
-            buffer = WriteStream(outfile)
-
-            self.files = sorted(self.files, key=lambda d: self.Hash(d["Name"]))
-            name_count = {}
-            hashes = []
-            for file in self.files:
-                hash = self.Hash(file["Name"])
-                hashes.append(hash)
-                name_count[file["Name"]] = hashes.count(hash)
-            name_offsets = {}
-            buffer.seek(self.header_size + self.sfat_header_size + 0x10 * len(self.files))
-            buffer.write(string(self.sfnt_magic))
-            buffer.write(u16(self.sfnt_header_size, bom))
-            buffer.write(padding(2))
-            name_table_offset = buffer.tell()
-            for file in self.files:
-                buffer.align_up(4)
-                if file["Name"] not in list(name_offsets.keys()):
-                    name_offsets[file["Name"]] = int((buffer.tell() - name_table_offset) / 4)
-                    buffer.write(string(file["Name"]) + b'\x00')
-            buffer.align_up(8)
-            data_offset = buffer.tell()
-            data_offsets = []
-            for i, file in enumerate(self.files):
-                start = buffer.tell() - data_offset
-                buffer.write(file["Data"])
-                end = buffer.tell() - data_offset
-                data_offsets.append((start, end))
-                if i != len(self.files) - 1:
-                    buffer.align_up(8)
-            filesize = buffer.tell()
-            buffer.seek(0)
-            buffer.write(string(self.magic))
-            buffer.write(u16(self.header_size, bom))
-            if bom == "<":
-                buffer.write(b'\xFF\xFE')
-            elif bom == ">":
-                buffer.write(b'\xFE\xFF')
-            buffer.write(u32(filesize, bom))
-            buffer.write(u32(data_offset, bom))
-            buffer.write(u16(self.version, bom))
-            buffer.write(padding(2))
-            buffer.write(string(self.sfat_magic))
-            buffer.write(u16(self.sfat_header_size, bom))
-            buffer.write(u16(len(self.files), bom))
-            buffer.write(u32(self.hash_mult, bom))
-            for file in self.files:
-                buffer.write(u32(self.Hash(file["Name"])))
-                buffer.write(u32((name_count[file["Name"]] << 24) + name_offsets[file["Name"]]))
-                buffer.write(u32(data_offsets[self.files.index(file)][0]))
-                buffer.write(u32(data_offsets[self.files.index(file)][1]))
-            buffer.seek(0)
-            data = buffer.read()
+        data = self.ToBytes(endianness)
+        with open(os.path.join(output_dir, filename), 'wb') as outfile:
+            outfile.write(data)
         return data
+
+    # Builds the SARC in memory and returns it
+    def ToBytes(self, endianness="little"):
+        bom = "<" if endianness.lower() == "little" else ">"
+        order, tables, starts = _layout([(file["Name"], len(file["Data"])) for file in self.files], bom, self.hash_mult)
+        self.files = [self.files[i] for i in order]
+        buffer = WriteStream()
+        buffer.write(tables)
+        data_offset = len(tables)
+        for file, start in zip(self.files, starts):
+            buffer.seek(data_offset + start)
+            buffer.write(file["Data"])
+        return buffer.getvalue()
+
+    # Streams a SARC to output (a path or writable stream) without holding the payloads in memory
+    # entries is an iterable of (name, source, size) where source is a path, a readable stream or a buffer
+    # Only names and sizes are used to lay out the tables, then each payload is copied through in chunks
+    # Pass a zstandard compressor (e.g. ZstdDecompContext.get_compressor(DictType.PACK)) to write a .pack.zs
+    # Returns the uncompressed archive size
+    @staticmethod
+    def StreamArchive(entries, output, endianness="little", compressor=None, chunk_size=1 << 20):
+        bom = "<" if endianness.lower() == "little" else ">"
+        entries = list(entries)
+        order, tables, starts = _layout([(name, size) for name, source, size in entries], bom)
+        filesize = len(tables) + (starts[-1] + entries[order[-1]][2] if entries else 0)
+        with contextlib.ExitStack() as stack:
+            if isinstance(output, (str, os.PathLike)):
+                output = stack.enter_context(open(output, 'wb'))
+            if compressor is not None:
+                output = stack.enter_context(compressor.stream_writer(output, size=filesize, closefd=False))
+            output.write(tables)
+            position = 0
+            for i, start in zip(order, starts):
+                name, source, size = entries[i]
+                output.write(padding(start - position))
+                _copy_payload(name, source, size, output, chunk_size)
+                position = start + size
+        return filesize
     
+    # Patches existing files of a SARC on disk without rebuilding it
+    # changes maps file names to their new data (bytes or a path, paths are memory-mapped)
+    # New data that fits in the file's current slot (up to the next file's data) is written in place,
+    # anything bigger is appended at the end of the archive and only its SFAT node is rewritten
+    # With output set, the archive is copied there first and the copy is patched instead
+    # Returns the number of bytes written
+    @staticmethod
+    def PatchArchive(path, changes, output='', alignment=8):
+        if output:
+            shutil.copyfile(path, output)
+            path = output
+        if isinstance(changes, dict):
+            changes = changes.items()
+        with open(path, 'r+b') as f:
+            header = f.read(0x14)
+            data_offset = struct.unpack_from("<I" if header[6:8] == b'\xFF\xFE' else ">I", header, 0xc)[0]
+            archive = Sarc(header + f.read(data_offset - 0x14), os.path.basename(path), lazy=True)
+            bom = archive.bom
+            data_size = os.fstat(f.fileno()).st_size - data_offset
+            nodes = [list(archive.GetNode(i)) for i in range(archive.file_count)]
+            # A file's slot runs up to the start of the next non-empty file in data order, empty files own no slot
+            # and files sharing their data (deduplicated) get an empty slot so they're never overwritten in place
+            filled = sorted((node[1], i) for i, node in enumerate(nodes) if node[2] > node[1])
+            starts = [start for start, i in filled] + [data_size]
+            slot_ends = {i: node[1] for i, node in enumerate(nodes)}
+            for k, (start, i) in enumerate(filled):
+                if not ((k > 0 and starts[k - 1] == start) or starts[k + 1] == start):
+                    slot_ends[i] = starts[k + 1]
+
+            # Maps of new data given as paths are closed once everything has been copied
+            with contextlib.ExitStack() as maps:
+                writes = []
+                append_at = data_size
+                for name, data in changes:
+                    index = archive.FindFile(name)
+                    if index == -1:
+                        raise KeyError(name)
+                    if isinstance(data, (str, os.PathLike)):
+                        data = map_file(data)
+                        if isinstance(data, mmap.mmap):
+                            maps.enter_context(data)
+                    size = len(data)
+                    node = nodes[index]
+                    if node[1] + size > slot_ends[index]:
+                        append_at += -append_at % alignment
+                        node[1] = append_at
+                        append_at += size
+                        slot_ends[index] = append_at
+                    node[2] = node[1] + size
+                    writes.append((data_offset + node[1], data))
+                    writes.append((archive.header_size + archive.sfat_header_size + 0x10 * index + 8,
+                                   u32(node[1], bom) + u32(node[2], bom)))
+                if not writes:
+                    return 0
+                if append_at != data_size:
+                    f.truncate(data_offset + append_at)
+                    writes.append((8, u32(data_offset + append_at, bom)))
+                with mmap.mmap(f.fileno(), 0) as mapped:
+                    for offset, data in writes:
+                        mapped[offset:offset + len(data)] = data
+                return sum(len(data) for offset, data in writes)
+
     # Removes specified file
     def RemoveFile(self, filepath):
         for file in self.files:
@@ -210,6 +336,14 @@ class Sarc:
             with open(filepath, 'rb') as file:
                 self.files.append({"Name" : filepath, "Data" : file.read()})
     
+    # Yields (name, path, size) for every file under a directory, for use with StreamArchive
+    @staticmethod
+    def DirectoryEntries(dirname):
+        for root_dir, dir, files in os.walk(dirname):
+            for file in files:
+                path = os.path.join(root_dir, file)
+                yield os.path.relpath(path, dirname).replace(os.sep, "/"), path, os.path.getsize(path)
+
     # Replaces specified file with new file
     def ReplaceFile(self, old_file, new_file):
         dir_path = os.path.dirname(old_file)
@@ -218,13 +352,21 @@ class Sarc:
 
     # Returns a list of all files in archive
     def ListFiles(self):
+        if self._files is None:
+            return [self.GetName(i) for i in range(self.file_count)]
         files = []
         for file in self.files:
             files.append(file["Name"])
         return files
 
-    # For RESTBL
+    # For RESTBL, sizes come from the SFAT until self.files has been built
     def ListFileInfo(self):
+        if self._files is None:
+            files = {}
+            for i in range(self.file_count):
+                hash, start, end = self.GetNode(i)
+                files[self.GetName(i)] = end - start
+            return files
         files = {}
         for file in self.files:
             files[file["Name"]] = len(file["Data"])
@@ -246,4 +388,133 @@ class Sarc:
             output += files[i]
             if i < len(files) - 1:
                 output += ', '
-        return output
\ No newline at end of file
+        return output
+
+# Unbuffered write straight from a memoryview, looping only if the OS accepts a partial write
+def _write_file(path, data):
+    with open(path, 'wb', buffering=0) as outfile:
+        view = memoryview(data)
+        while view:
+            view = view[outfile.write(view):]
+
+# Filename hash algorithm: hash = hash * multiplier + byte over the name's bytes, truncated to 32 bits
+# Expanded to sum(byte * multiplier ** (n - 1 - i)) with the powers precomputed mod 2**32, so the per-byte
+# multiply-add runs in C on small ints instead of a Python loop over an ever-growing int
+_hash_powers = {} # Multiplier -> [1, multiplier, multiplier ** 2, ...] mod 2**32
+_hash_powers_lock = threading.Lock()
+
+# Published tables are never modified, longer ones are built under the lock and swapped in whole
+def _get_hash_powers(multiplier, length):
+    powers = _hash_powers.get(multiplier)
+    if powers is not None and len(powers) >= length:
+        return powers
+    with _hash_powers_lock:
+        powers = _hash_powers.get(multiplier, [1])
+        if len(powers) < length:
+            powers = powers.copy()
+            while len(powers) < length:
+                powers.append(powers[-1] * multiplier & 0xFFFFFFFF)
+            _hash_powers[multiplier] = powers
+        return powers
+
+def _hash_bytes(data, multiplier):
+    return sum(map(operator.mul, reversed(data), _get_hash_powers(multiplier, len(data)))) & 0xFFFFFFFF
+
+@lru_cache(maxsize=0x10000)
+def _hash_str(filename, multiplier):
+    return _hash_bytes(filename.encode('utf-8'), multiplier)
+
+# Memoized by name for str input
+def sarc_hash(filename, multiplier=101):
+    if type(filename) == str:
+        return _hash_str(filename, multiplier)
+    return _hash_bytes(bytes(filename), multiplier)
+
+# Hashes a list of names in one call, vectorized with numpy when it's installed
+def sarc_hashes(filenames, multiplier=101):
+    filenames = list(filenames)
+    if numpy is None or len(filenames) < 64:
+        return [sarc_hash(filename, multiplier) for filename in filenames]
+    encoded = [filename.encode('utf-8') if type(filename) == str else bytes(filename) for filename in filenames]
+    length = max(map(len, encoded))
+    # Left-pad every name to the same length (leading zeros don't change the hash) and take one dot product per row
+    table = numpy.frombuffer(b''.join(data.rjust(length, b'\x00') for data in encoded), numpy.uint8)
+    powers = numpy.array(_get_hash_powers(multiplier, length)[length - 1::-1] if length else [], numpy.uint32)
+    hashes = (table.reshape(len(encoded), length).astype(numpy.uint32) * powers).sum(axis=1, dtype=numpy.uint32)
+    return hashes.tolist()
+
+# Lays out a SARC from (name, size) pairs without touching any file data
+# Returns the order of the entries sorted by hash, the header/SFAT/SFNT bytes (padded up to the data section)
+# and each sorted entry's offset into the data section
+def _layout(entries, bom, hash_mult=101):
+    # Hash each name once, entries with the same hash get increasing collision counters in sorted order
+    names = list({name: None for name, size in entries})
+    hashes = dict(zip(names, sarc_hashes(names, hash_mult)))
+    order = sorted(range(len(entries)), key=lambda i: hashes[entries[i][0]])
+    hash_counts = {}
+    name_count = {}
+    for i in order:
+        hash = hashes[entries[i][0]]
+        hash_counts[hash] = hash_counts.get(hash, 0) + 1
+        name_count[entries[i][0]] = hash_counts[hash]
+
+    header_size, sfat_header_size, sfnt_header_size = 0x14, 0x0c, 0x08
+    buffer = WriteStream()
+    buffer.seek(header_size + sfat_header_size + 0x10 * len(entries))
+    buffer.write(string("SFNT"))
+    buffer.write(u16(sfnt_header_size, bom))
+    buffer.write(padding(2))
+    name_table_offset = buffer.tell()
+    name_offsets = {}
+    for i in order:
+        name = entries[i][0]
+        buffer.align_up(4)
+        if name not in name_offsets:
+            name_offsets[name] = (buffer.tell() - name_table_offset) // 4
+            buffer.write(string(name) + b'\x00')
+    buffer.write(padding(-buffer.tell() % 8))
+    data_offset = buffer.tell()
+
+    sfat = []
+    starts = []
+    end = 0
+    for i in order:
+        name, size = entries[i]
+        start = (end + 7) & ~7 if starts else 0
+        end = start + size
+        starts.append(start)
+        sfat.append(u32(hashes[name], bom) + u32((name_count[name] << 24) + name_offsets[name], bom)
+                    + u32(start, bom) + u32(end, bom))
+    buffer.seek(0)
+    buffer.write(string("SARC"))
+    buffer.write(u16(header_size, bom))
+    buffer.write(b'\xFF\xFE' if bom == "<" else b'\xFE\xFF')
+    buffer.write(u32(data_offset + end, bom))
+    buffer.write(u32(data_offset, bom))
+    buffer.write(u16(0x100, bom))
+    buffer.write(padding(2))
+    buffer.write(string("SFAT"))
+    buffer.write(u16(sfat_header_size, bom))
+    buffer.write(u16(len(entries), bom))
+    buffer.write(u32(hash_mult, bom))
+    buffer.write(b''.join(sfat))
+    return order, buffer.getvalue(), starts
+
+# Copies exactly size bytes of a payload from a path, readable stream or buffer into output
+def _copy_payload(name, source, size, output, chunk_size):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return _copy_payload(name, f, size, output, chunk_size)
+    if not hasattr(source, "read"):
+        source = memoryview(source)
+        if source.nbytes != size:
+            raise ValueError(f"{name}: expected {size} bytes but got {source.nbytes}")
+        output.write(source)
+        return
+    remaining = size
+    while remaining:
+        chunk = source.read(min(chunk_size, remaining))
+        if not chunk:
+            raise ValueError(f"{name}: expected {size} bytes but got {size - remaining}")
+        output.write(chunk)
+        remaining -= len(chunk)
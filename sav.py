@@ -1,4 +1,5 @@
 from utils import *
+from hashing import hash_name
 import json
 from functools import lru_cache
 from typing import Dict, List
@@ -91,6 +92,7 @@ reverse_map: Dict[int, str] = {
 
 class Sav:
 
+    # data can be any buffer, including a memory-mapped file (see from_file)
     def __init__(self, data: bytes) -> None:
         stream: ReadStream = ReadStream(data)
         self.size = len(data)
@@ -143,9 +145,7 @@ class Sav:
                             pos: int = stream.tell()
                             stream.seek(offset)
                             count: int = stream.read_u32()
-                            value: List[int] = []
-                            for i in range(count):
-                                value.append(stream.read_s32())
+                            value: List[int] = stream.read_array("s32", count).tolist()
                             stream.seek(pos)
                     case "Float":
                         value: float = stream.read_f32()
@@ -155,9 +155,7 @@ class Sav:
                             pos: int = stream.tell()
                             stream.seek(offset)
                             count: int = stream.read_u32()
-                            value: List[float] = []
-                            for i in range(count):
-                                value.append(stream.read_f32())
+                            value: List[float] = stream.read_array("f32", count).tolist()
                             stream.seek(pos)
                     case "Enum":
                         value = stream.read_u32()
@@ -167,10 +165,8 @@ class Sav:
                             pos: int = stream.tell()
                             stream.seek(offset)
                             count: int = stream.read_u32()
-                            value: List[str] = []
-                            for i in range(count):
-                                # value.append(self.get_array_enum(hex(stream.read_u32()).upper()[2:].zfill(8), hash))
-                                value.append(stream.read_u32())
+                            value: List[int] = stream.read_array("u32", count).tolist()
+                            # value = [self.get_array_enum(hex(v).upper()[2:].zfill(8), hash) for v in value]
                             stream.seek(pos)
                     case "Vector2":
                         offset: int = stream.read_u32()
@@ -185,9 +181,8 @@ class Sav:
                             pos: int = stream.tell()
                             stream.seek(offset)
                             count: int = stream.read_u32()
-                            value: List[List[float, float]] = []
-                            for i in range(count):
-                                value.append([stream.read_f32(), stream.read_f32()])
+                            values: List[float] = stream.read_array("f32", count * 2).tolist()
+                            value: List[List[float, float]] = [values[i:i + 2] for i in range(0, count * 2, 2)]
                             stream.seek(pos)
                     case "Vector3":
                         offset: int = stream.read_u32()
@@ -202,9 +197,8 @@ class Sav:
                             pos: int = stream.tell()
                             stream.seek(offset)
                             count: int = stream.read_u32()
-                            value: List[List[float, float, float]] = []
-                            for i in range(count):
-                                value.append([stream.read_f32(), stream.read_f32(), stream.read_f32()])
+                            values: List[float] = stream.read_array("f32", count * 3).tolist()
+                            value: List[List[float, float, float]] = [values[i:i + 3] for i in range(0, count * 3, 3)]
                             stream.seek(pos)
                     case "String16":
                         offset: int = stream.read_u32()
@@ -293,9 +287,7 @@ class Sav:
                             pos: int = stream.tell()
                             stream.seek(offset)
                             count: int = stream.read_u32()
-                            value: List[int] = []
-                            for i in range(count):
-                                value.append(stream.read_u32())
+                            value: List[int] = stream.read_array("u32", count).tolist()
                             stream.seek(pos)
                     case "Int64":
                         offset: int = stream.read_u32()
@@ -310,9 +302,7 @@ class Sav:
                             pos: int = stream.tell()
                             stream.seek(offset)
                             count: int = stream.read_u32()
-                            value: List[int] = []
-                            for i in range(count):
-                                value.append(stream.read_s64())
+                            value: List[int] = stream.read_array("s64", count).tolist()
                             stream.seek(pos)
                     case "UInt64":
                         offset: int = stream.read_u32()
@@ -327,9 +317,7 @@ class Sav:
                             pos: int = stream.tell()
                             stream.seek(offset)
                             count: int = stream.read_u32()
-                            value: List[int] = []
-                            for i in range(count):
-                                value.append(stream.read_u64())
+                            value: List[int] = stream.read_array("u64", count).tolist()
                             stream.seek(pos)
                     case "WString16":
                         offset: int = stream.read_u32()
@@ -404,6 +392,10 @@ class Sav:
                             stream.seek(pos)
                 self.save_data[self.datatype][hash] = value
 
+    @classmethod
+    def from_file(cls, path: str, use_mmap: bool = False) -> "Sav":
+        return cls(load_file(path, use_mmap))
+
     def to_json(self, output: str = '') -> None:
         from os.path import join
         with open(join(output, 'output.json'), 'w', encoding='utf-8') as f:
@@ -426,245 +418,249 @@ class Sav:
 
     def serialize(self, path: str) -> None:
         with open(path, "wb") as f:
-            stream = WriteStream(f)
-            stream.write(u32(0x01020304))
-            stream.write(u32(self.format_version))
-            stream.write(u32(self.offset))
-            stream.seek(self.size - 1)
-            stream.write(b'\x00')
-            stream.seek(0x20)
-
-            offset = self.offset
-            for t in self.save_data:
-                stream.write(u32(0))
-                stream.write(u32(reverse_map[t]))
-                for flag in self.save_data[t]:
-                    value = self.save_data[t][flag]
-                    stream.write(u32(flag))
-                    match t:
-                        case "Bool":
-                            stream.write(u32(1 if value else 0))
-                        case "BoolArray":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                stream.write(Sav.bool_array_to_bits(value))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Int":
-                            stream.write(s32(value))
-                        case "IntArray":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(s32(v))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Float":
-                            stream.write(f32(value))
-                        case "FloatArray":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(f32(v))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Enum":
-                            stream.write(u32(value))
-                        case "EnumArray":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(u32(v))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Vector2":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(f32(value[0]))
-                                stream.write(f32(value[1]))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Vector2Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(f32(v[0]))
-                                    stream.write(f32(v[1]))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Vector3":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(f32(value[0]))
-                                stream.write(f32(value[1]))
-                                stream.write(f32(value[2]))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Vector3Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(f32(v[0]))
-                                    stream.write(f32(v[1]))
-                                    stream.write(f32(v[2]))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "String16":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(value.encode("utf-8")[0:15].ljust(16, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "String16Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(v.encode("utf-8")[0:15].ljust(16, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "String32":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(value.encode("utf-8")[0:31].ljust(32, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "String32Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(v.encode("utf-8")[0:31].ljust(32, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "String64":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(value.encode("utf-8")[0:63].ljust(64, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "String64Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(v.encode("utf-8")[0:63].ljust(64, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Binary":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                data = base64.b64decode(value)
+            f.write(self.to_bytes())
+
+    def to_bytes(self) -> bytes:
+        stream = WriteStream()
+        stream.write(u32(0x01020304))
+        stream.write(u32(self.format_version))
+        stream.write(u32(self.offset))
+        stream.seek(self.size - 1)
+        stream.write(b'\x00')
+        stream.seek(0x20)
+
+        offset = self.offset
+        for t in self.save_data:
+            stream.write(u32(0))
+            stream.write(u32(reverse_map[t]))
+            for flag in self.save_data[t]:
+                value = self.save_data[t][flag]
+                stream.write(u32(flag))
+                match t:
+                    case "Bool":
+                        stream.write(u32(1 if value else 0))
+                    case "BoolArray":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            stream.write(Sav.bool_array_to_bits(value))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Int":
+                        stream.write(s32(value))
+                    case "IntArray":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(s32(v))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Float":
+                        stream.write(f32(value))
+                    case "FloatArray":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(f32(v))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Enum":
+                        stream.write(u32(value))
+                    case "EnumArray":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(u32(v))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Vector2":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(f32(value[0]))
+                            stream.write(f32(value[1]))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Vector2Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(f32(v[0]))
+                                stream.write(f32(v[1]))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Vector3":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(f32(value[0]))
+                            stream.write(f32(value[1]))
+                            stream.write(f32(value[2]))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Vector3Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(f32(v[0]))
+                                stream.write(f32(v[1]))
+                                stream.write(f32(v[2]))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "String16":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(value.encode("utf-8")[0:15].ljust(16, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "String16Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(v.encode("utf-8")[0:15].ljust(16, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "String32":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(value.encode("utf-8")[0:31].ljust(32, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "String32Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(v.encode("utf-8")[0:31].ljust(32, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "String64":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(value.encode("utf-8")[0:63].ljust(64, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "String64Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(v.encode("utf-8")[0:63].ljust(64, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Binary":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            data = base64.b64decode(value)
+                            stream.write(u32(len(data)))
+                            stream.write(data)
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "BinaryArray":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                data = base64.b64decode(v)
                                 stream.write(u32(len(data)))
                                 stream.write(data)
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "BinaryArray":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    data = base64.b64decode(v)
-                                    stream.write(u32(len(data)))
-                                    stream.write(data)
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "UInt":
-                            stream.write(u32(value))
-                        case "UIntArray":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(u32(v))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Int64":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(s64(value))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Int64Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(s64(v))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "UInt64":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u64(value))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "UInt64Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(u64(v))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "WString16":
-                            stream.write(u16(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(value.encode("utf-16-le")[0:30].ljust(32, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "WString16Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(v.encode("utf-16-le")[0:30].ljust(32, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "WString32":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(value.encode("utf-16-le")[0:62].ljust(64, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "WString32Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(v.encode("utf-16-le")[0:62].ljust(64, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "WString64":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(value.encode("utf-16-le")[0:126].ljust(128, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "WString64Array":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                stream.write(u32(len(value)))
-                                for v in value:
-                                    stream.write(v.encode("utf-16-le")[0:126].ljust(128, b"\x00"))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case "Bool64bitKey":
-                            stream.write(u32(offset))
-                            with SeekContext(stream, offset):
-                                for v in value:
-                                    stream.write(u64(int(v, 16)))
-                                stream.write(u64(0))
-                                stream.align_up(4)
-                                offset = stream.tell()
-                        case _:
-                            raise ValueError(f"Invalid type {t}")
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "UInt":
+                        stream.write(u32(value))
+                    case "UIntArray":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(u32(v))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Int64":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(s64(value))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Int64Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(s64(v))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "UInt64":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u64(value))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "UInt64Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(u64(v))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "WString16":
+                        stream.write(u16(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(value.encode("utf-16-le")[0:30].ljust(32, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "WString16Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(v.encode("utf-16-le")[0:30].ljust(32, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "WString32":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(value.encode("utf-16-le")[0:62].ljust(64, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "WString32Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(v.encode("utf-16-le")[0:62].ljust(64, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "WString64":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(value.encode("utf-16-le")[0:126].ljust(128, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "WString64Array":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            stream.write(u32(len(value)))
+                            for v in value:
+                                stream.write(v.encode("utf-16-le")[0:126].ljust(128, b"\x00"))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case "Bool64bitKey":
+                        stream.write(u32(offset))
+                        with SeekContext(stream, offset):
+                            for v in value:
+                                stream.write(u64(int(v, 16)))
+                            stream.write(u64(0))
+                            stream.align_up(4)
+                            offset = stream.tell()
+                    case _:
+                        raise ValueError(f"Invalid type {t}")
+        return stream.getvalue()
 
     @staticmethod
     def apply_diff(diff_path: str, path: str) -> None:
@@ -676,7 +672,7 @@ class Sav:
             if t not in save.save_data:
                 save.save_data[t] = {}
             if t == "Bool64bitKey":
-                hash = mmh3.hash("Game", signed=False)
+                hash = hash_name("Game")
                 keys = set(save.save_data[t][hash])
                 keys.update(set(diff[t]["Game"]["New"]))
                 save.save_data[t][hash] = list(keys - set(diff[t]["Game"]["Old"]))
@@ -685,20 +681,20 @@ class Sav:
                     if flag.startswith("0x"):
                         hash = int(flag, 16)
                     else:
-                        hash = mmh3.hash(flag, signed=False)
+                        hash = hash_name(flag)
                     if diff[t][flag]["New"] is None:
                         del save.save_data[t][hash]
                     else:
                         if "Enum" not in t:
                             save.save_data[t][hash] = diff[t][flag]["New"]
                         else:
-                            save.save_data[t][hash] = mmh3.hash(diff[t][flag]["New"], signed=False)
+                            save.save_data[t][hash] = hash_name(diff[t][flag]["New"])
             else:
                 for flag in diff[t]:
                     if flag.startswith("0x"):
                         hash = int(flag, 16)
                     else:
-                        hash = mmh3.hash(flag, signed=False)
+                        hash = hash_name(flag)
                     for v in diff[t][flag]:
                         if diff[t][flag][v]["New"] is None:
                             raise ValueError("Array resizing is not supported")
@@ -707,7 +703,7 @@ class Sav:
                         if "Enum" not in t:
                             save.save_data[t][hash][int(v)] = diff[t][flag][v]["New"]
                         else:
-                            save.save_data[t][hash][int(v)] = mmh3.hash(diff[t][flag][v]["New"], signed=False)
+                            save.save_data[t][hash][int(v)] = hash_name(diff[t][flag][v]["New"])
         save.serialize(path)
 
 from pathlib import Path
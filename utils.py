@@ -1,17 +1,47 @@
 # Largely adapated from https://github.com/zeldamods/evfl
 import struct
 import io
+import os
+import sys
+import mmap
+import array
 import binascii
+from hashing import hash_name
 try:
-    import mmh3
+    import numpy
 except ImportError:
-    raise ImportError("mmh3 not found, try running pip install mmh3 then try again")
-
-def get_string(data, offset):
-    if type(data) != bytes:
+    numpy = None # Optional, bulk array reads fall back to array.array
+
+# Maps a file read-only so parsers can work on the page cache instead of a private copy
+def map_file(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: # Empty files can't be mapped
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+# Returns the contents of path either memory-mapped or read into bytes
+def load_file(path, use_mmap=False):
+    if use_mmap:
+        return map_file(path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+# Decodes the null-terminated string at offset, ReadStreams are searched in place from their current position
+# memo is an optional offset -> str dict shared by lookups into the same string table
+def get_string(data, offset, memo=None):
+    if isinstance(data, ReadStream):
+        return data.string_at(data.tell() + offset, memo)
+    if memo is not None and offset in memo:
+        return memo[offset]
+    if not isinstance(data, (bytes, bytearray, mmap.mmap)):
         data = data.read()
     end = data.find(b'\x00', offset)
-    return data[offset:end].decode('utf-8')
+    if end == -1:
+        end = len(data)
+    string = str(memoryview(data)[offset:end], 'utf-8')
+    if memo is not None:
+        memo[offset] = string
+    return string
 
 class Stream:
     __slots__ = ["stream"]
@@ -28,61 +58,178 @@ class Stream:
     def skip(self, skip_size) -> None:
         self.stream.seek(skip_size, 1)
 
-class ReadStream(Stream):
+# Precompiled scalar decoders keyed by endianness so reads don't rebuild format strings
+_S16 = {"<": struct.Struct("<h").unpack_from, ">": struct.Struct(">h").unpack_from}
+_U16 = {"<": struct.Struct("<H").unpack_from, ">": struct.Struct(">H").unpack_from}
+_S32 = {"<": struct.Struct("<i").unpack_from, ">": struct.Struct(">i").unpack_from}
+_U32 = {"<": struct.Struct("<I").unpack_from, ">": struct.Struct(">I").unpack_from}
+_S64 = {"<": struct.Struct("<q").unpack_from, ">": struct.Struct(">q").unpack_from}
+_U64 = {"<": struct.Struct("<Q").unpack_from, ">": struct.Struct(">Q").unpack_from}
+_F32 = {"<": struct.Struct("<f").unpack_from, ">": struct.Struct(">f").unpack_from}
+_F64 = {"<": struct.Struct("<d").unpack_from, ">": struct.Struct(">d").unpack_from}
+_BYTEORDER = {"<": "little", ">": "big"}
+_NATIVE = "<" if sys.byteorder == "little" else ">"
+
+# Element kinds for bulk reads -> (array typecode, struct/numpy code, size)
+ARRAY_KINDS = {
+    "u8": ("B", "u1", 1),
+    "s8": ("b", "i1", 1),
+    "u16": ("H", "u2", 2),
+    "s16": ("h", "i2", 2),
+    "u32": ("I", "u4", 4),
+    "s32": ("i", "i4", 4),
+    "u64": ("Q", "u8", 8),
+    "s64": ("q", "i8", 8),
+    "f32": ("f", "f4", 4),
+    "f64": ("d", "f8", 8),
+}
+
+# Decodes count elements of the given kind from buffer at offset in a single call
+# Returns a read-only NumPy view when NumPy is available, otherwise an array.array
+# The view shares memory with buffer (and keeps it exported), release it before closing an mmap passed in
+def unpack_array(kind, buffer, offset, count, end="<", use_numpy=True):
+    if kind not in ARRAY_KINDS:
+        raise ValueError(f"Invalid array kind: {kind}")
+    typecode, dtype, size = ARRAY_KINDS[kind]
+    view = memoryview(buffer).cast("B")
+    if count < 0 or offset + count * size > len(view):
+        raise struct.error(f"Buffer too small for {count} {kind} elements at offset {hex(offset)}")
+    if use_numpy and numpy is not None:
+        if not count:
+            return numpy.empty(0, dtype=numpy.dtype(end + dtype))
+        values = numpy.frombuffer(view, dtype=numpy.dtype(end + dtype), count=count, offset=offset)
+        values.setflags(write=False) # frombuffer views of writable buffers (bytearray, mmap) are writable
+        return values
+    values = array.array(typecode)
+    values.frombytes(view[offset:offset + count * size])
+    if end != _NATIVE and size > 1:
+        values.byteswap()
+    return values
+
+# Cursor reader over a memoryview - scalars are decoded in place with unpack_from
+class ReadStream:
+    __slots__ = ["data", "_view", "_pos", "_find"]
+
     def __init__(self, data) -> None:
-        stream = io.BytesIO(memoryview(data))
-        super().__init__(stream)
         self.data = data
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+        # Byte-addressed buffers can be searched directly, anything else goes through find()'s chunked scan
+        self._find = data.find if isinstance(data, (bytes, bytearray, mmap.mmap)) else None
+
+    @classmethod
+    def from_file(cls, path, use_mmap=False):
+        return cls(load_file(path, use_mmap))
+
+    @property
+    def mapped(self) -> bool:
+        return isinstance(self.data, mmap.mmap)
+
+    def seek(self, offset, whence=io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def skip(self, skip_size) -> None:
+        self._pos += skip_size
+
+    def align_up(self, alignment) -> None:
+        self._pos += -self._pos % alignment
+
+    def read(self, size=-1) -> bytes:
+        return bytes(self.read_view(size))
+
+    # Same as read() but returns a slice of the underlying buffer instead of a copy
+    def read_view(self, size=-1) -> memoryview:
+        pos = self._pos
+        if size is None or size < 0:
+            end = len(self._view)
+        else:
+            end = min(pos + size, len(self._view))
+        self._pos = max(end, pos)
+        return self._view[pos:end]
 
-    def read(self, *args) -> bytes:
-        return self.stream.read(*args)
-    
     def read_u8(self, end="<") -> int:
-        return struct.unpack(f"{end}B", self.read(1))[0]
+        pos = self._pos
+        self._pos = pos + 1
+        return self._view[pos]
     
     def read_u16(self, end="<") -> int:
-        return struct.unpack(f"{end}H", self.read(2))[0]
+        pos = self._pos
+        self._pos = pos + 2
+        return _U16[end](self._view, pos)[0]
     
     def read_s16(self, end="<") -> int:
-        return struct.unpack(f"{end}h", self.read(2))[0]
+        pos = self._pos
+        self._pos = pos + 2
+        return _S16[end](self._view, pos)[0]
     
+    # 24-bit values are read as a 32-bit word and masked, the tail of the buffer falls back to from_bytes
     def read_u24(self, end="<") -> int:
+        pos = self._pos
+        self._pos = pos + 3
         if end == "<":
-            return struct.unpack(f"{end}I", self.read(3) + b'\x00')[0]
-        else:
-            return struct.unpack(f"{end}I", b'\x00' + self.read(3))[0]
+            if pos + 4 <= len(self._view):
+                return _U32["<"](self._view, pos)[0] & 0xFFFFFF
+        elif pos > 0:
+            return _U32[">"](self._view, pos - 1)[0] & 0xFFFFFF
+        if pos + 3 > len(self._view):
+            raise struct.error("unpack_from requires a buffer of at least 3 bytes")
+        return int.from_bytes(self._view[pos:pos + 3], _BYTEORDER[end])
         
     def read_s24(self, end="<") -> int:
-        if end == "<":
-            return struct.unpack(f"{end}i", self.read(3) + b'\x00')[0]
-        else:
-            return struct.unpack(f"{end}i", b'\x00' + self.read(3))[0]
+        value = self.read_u24(end)
+        return value - 0x1000000 if value & 0x800000 else value
     
     def read_u32(self, end="<") -> int:
-        return struct.unpack(f"{end}I", self.read(4))[0]
+        pos = self._pos
+        self._pos = pos + 4
+        return _U32[end](self._view, pos)[0]
     
     def read_s32(self, end="<") -> int:
-        return struct.unpack(f"{end}i", self.read(4))[0]
+        pos = self._pos
+        self._pos = pos + 4
+        return _S32[end](self._view, pos)[0]
     
     def read_u64(self, end="<") -> int:
-        return struct.unpack(f"{end}Q", self.read(8))[0]
+        pos = self._pos
+        self._pos = pos + 8
+        return _U64[end](self._view, pos)[0]
     
     def read_s64(self, end="<") -> int:
-        return struct.unpack(f"{end}q", self.read(8))[0]
+        pos = self._pos
+        self._pos = pos + 8
+        return _S64[end](self._view, pos)[0]
     
     def read_ptr(self, align=8, end="<") -> int:
-        while self.stream.tell() % align != 0:
-            self.read(1)
-        return struct.unpack(f"{end}Q", self.read(8))[0]
+        self.align_up(align)
+        return self.read_u64(end)
+
+    def read_array(self, kind, count, end="<", use_numpy=True):
+        values = unpack_array(kind, self._view, self._pos, count, end, use_numpy)
+        self._pos += count * ARRAY_KINDS[kind][2]
+        return values
     
     def read_f32(self, end="<") -> float:
-        return struct.unpack(f"{end}f", self.read(4))[0]
+        pos = self._pos
+        self._pos = pos + 4
+        return _F32[end](self._view, pos)[0]
     
     def read_f64(self, end="<") -> float:
-        return struct.unpack(f"{end}d", self.read(4))[0]
+        pos = self._pos
+        self._pos = pos + 8
+        return _F64[end](self._view, pos)[0]
 
-    def read_string(self, offset=None, size=4): # Data should be a slice beginning at the string pool
-        pos = self.stream.tell()
+    def read_string(self, offset=None, size=4, memo=None): # Data should be a slice beginning at the string pool
+        pos = self._pos
         if offset == None:
             if size == 4:
                 ptr = self.read_u32()
@@ -94,17 +241,45 @@ class ReadStream(Stream):
                 raise Exception("Please provide relative offset for other data sizes")
         else:
             ptr = offset
-        string = get_string(self.stream, ptr)
-        self.stream.seek(pos)
+        string = self.string_at(self._pos + ptr, memo)
+        self._pos = pos
         return string
 
     def read_string_sarc(self):
-        string = b''
-        current_char = self.stream.read(1)
-        while current_char != b'\x00':
-            string += current_char
-            current_char = self.stream.read(1)
-        return string.decode('utf-8')
+        string_end = self.find(b'\x00', self._pos)
+        if string_end == -1:
+            string_end = len(self._view)
+        string = str(self._view[self._pos:string_end], 'utf-8')
+        self._pos = string_end + 1
+        return string
+
+    # Decodes the null-terminated string at an absolute offset without moving the cursor
+    def string_at(self, offset, memo=None):
+        if memo is not None:
+            string = memo.get(offset)
+            if string is not None:
+                return string
+        string_end = self.find(b'\x00', offset)
+        if string_end == -1:
+            string_end = len(self._view)
+        string = str(self._view[offset:string_end], 'utf-8')
+        if memo is not None:
+            memo[offset] = string
+        return string
+
+    def find(self, sub, start=0) -> int:
+        if self._find is not None:
+            return self._find(sub, start)
+        view = self._view
+        overlap = len(sub) - 1
+        chunk_size = 0x100
+        while start < len(view):
+            index = bytes(view[start:start + chunk_size + overlap]).find(sub)
+            if index != -1:
+                return start + index
+            start += chunk_size
+            chunk_size = min(chunk_size * 2, 0x10000)
+        return -1
     
 class PlaceholderWriter:
     __slots__ = ["_offset"]
@@ -113,51 +288,177 @@ class PlaceholderWriter:
         self._offset = offset
 
     def write(self, stream, data):
+        if isinstance(stream, WriteStream):
+            stream.write_at_offset(data, self._offset)
+            return
         pos = stream.tell()
         stream.seek(self._offset)
         stream.write(data)
         stream.seek(pos)
 
-class WriteStream(Stream):
-    def __init__(self, stream):
-        super().__init__(stream)
-        self._string_list = [] # List of strings in file
-        self._strings = b'' # String pool to write to file
-        self._string_refs = {} # Maps strings to relative offsets
-        self._string_list_exb = [] # List of strings in file
-        self._strings_exb = b'' # String pool to write to file
-        self._string_refs_exb = {} # Maps strings to relative offsets
+# Growable in-memory output, patches go straight into the bytearray instead of through seek/write syscalls
+class MemoryStream:
+    __slots__ = ["_buffer", "_pos"]
 
-    def add_string(self, string):
-        if string not in self._string_list:
+    def __init__(self, initial=b'') -> None:
+        self._buffer = bytearray(initial)
+        self._pos = 0
+
+    def seek(self, offset, whence=io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def write(self, data) -> int:
+        size = len(data)
+        self.patch(self._pos, data)
+        self._pos += size
+        return size
+
+    # Writes data at offset without moving the cursor, gaps past the end are zero-filled like a file
+    def patch(self, offset, data) -> None:
+        buffer = self._buffer
+        if offset == len(buffer):
+            buffer += data
+            return
+        if offset > len(buffer):
+            buffer.extend(bytes(offset - len(buffer)))
+        buffer[offset:offset + len(data)] = data
+
+    def read(self, size=-1) -> bytes:
+        pos = self._pos
+        end = len(self._buffer) if size is None or size < 0 else pos + size
+        data = bytes(self._buffer[pos:end])
+        self._pos = max(pos, min(end, len(self._buffer)))
+        return data
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._buffer)
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buffer)
+
+# Interned string pool - O(1) membership and amortized appends, offsets are stable once assigned
+class StringPool:
+    __slots__ = ["_refs", "_data"]
+
+    def __init__(self):
+        self._refs = {} # Maps strings to relative offsets
+        self._data = bytearray() # String pool to write to file
+
+    def add(self, string) -> int:
+        offset = self._refs.get(string)
+        if offset is None:
+            offset = len(self._data)
+            self._refs[string] = offset
             encoded = string.encode()
-            self._string_list.append(string)
-            self._string_refs[string] = len(self._strings)
-            self._strings += encoded
+            self._data += encoded
             if encoded[-1:] != b'\x00': # All strings must end with a null termination character
-                self._strings += b'\x00'
+                self._data.append(0)
+        return offset
+
+    def offset(self, string) -> int:
+        return self._refs[string]
+
+    def __contains__(self, string) -> bool:
+        return string in self._refs
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    @property
+    def size(self) -> int:
+        return len(self._data)
+
+    @property
+    def strings(self) -> list:
+        return list(self._refs)
+
+    @property
+    def refs(self) -> dict:
+        return self._refs
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._data)
+
+    # Emits the whole pool in a single write, returns the offset it was written at
+    def write_to(self, stream) -> int:
+        offset = stream.tell()
+        stream.write(self._data)
+        return offset
+
+# Writes to the given file object, or to an in-memory MemoryStream when none is given
+class WriteStream(Stream):
+    def __init__(self, stream=None):
+        super().__init__(stream if stream is not None else MemoryStream())
+        self.string_pool = StringPool()
+        self.string_pool_exb = StringPool()
+
+    def add_string(self, string):
+        return self.string_pool.add(string)
 
     def add_string_exb(self, string):
-        if string not in self._string_list_exb:
-            encoded = string.encode()
-            self._string_list_exb.append(string)
-            self._string_refs_exb[string] = len(self._strings_exb)
-            self._strings_exb += encoded
-            if encoded[-1:] != b'\x00': # All strings must end with a null termination character
-                self._strings_exb += b'\x00'
+        return self.string_pool_exb.add(string)
+
+    def write_string_pool(self, exb=False):
+        return (self.string_pool_exb if exb else self.string_pool).write_to(self)
+
+    # Views kept for writers that still use the old attribute names
+    @property
+    def _string_list(self):
+        return self.string_pool.strings
+
+    @property
+    def _strings(self):
+        return self.string_pool.to_bytes()
+
+    @property
+    def _string_refs(self):
+        return self.string_pool.refs
+
+    @property
+    def _string_list_exb(self):
+        return self.string_pool_exb.strings
+
+    @property
+    def _strings_exb(self):
+        return self.string_pool_exb.to_bytes()
+
+    @property
+    def _string_refs_exb(self):
+        return self.string_pool_exb.refs
 
     def write(self, data):
         self.stream.write(data)
 
     def write_at_offset(self, data, offset):
+        if isinstance(self.stream, MemoryStream):
+            self.stream.patch(offset, data)
+            return
         pos = self.stream.tell()
         self.stream.seek(offset)
         self.write(data)
         self.stream.seek(pos)
 
     def align_up(self, alignment):
-        while self.stream.tell() % alignment != 0:
-            self.skip(1)
+        self.skip(-self.stream.tell() % alignment)
+
+    # Only valid for in-memory streams
+    def getvalue(self) -> bytes:
+        return self.stream.getvalue()
+
+    # Flushes an in-memory stream to disk in a single write
+    def write_file(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.stream.getbuffer())
 
     def read(self, *args) -> bytes:
         return self.stream.read(*args)
@@ -199,6 +500,11 @@ class WriteStream(Stream):
         while self.stream.tell() % align != 0:
             self.read(1)
         return struct.unpack(f"{end}Q", self.read(8))[0]
+
+    def read_array(self, kind, count, end="<", use_numpy=True):
+        if kind not in ARRAY_KINDS:
+            raise ValueError(f"Invalid array kind: {kind}")
+        return unpack_array(kind, self.read(count * ARRAY_KINDS[kind][2]), 0, count, end, use_numpy)
     
     def read_f32(self, end="<") -> float:
         return struct.unpack(f"{end}f", self.read(4))[0]
@@ -299,7 +605,7 @@ def padding(count):
     return struct.pack(f"{count}s", b'\x00')
 
 def hash(value):
-    return mmh3.hash(value, signed=False)
+    return hash_name(value)
 
 def crc32(value):
     return binascii.crc32(value)
\ No newline at end of file
@@ -11,17 +11,37 @@ except ImportError:
         import sarc
     except ImportError:
         raise ImportError("sarc.py not found")
-from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple, Union
+import concurrent.futures
+import contextlib
 import enum
+import hashlib
+import io
+import mmap
+import os
 import sys
+import threading
 
 class DictType(enum.Enum):
     ZSDIC = 1
     BCETT = 2
     PACK  = 3
 
+# Picks the dictionary the game uses for a file, with or without the .zs extension
+def get_dict_type(filename: str) -> DictType:
+    name: str = os.path.basename(filename)
+    if name.endswith(".zs"):
+        name = name[:-3]
+    if name.endswith(".pack"):
+        return DictType.PACK
+    elif name.endswith(".bcett.byml"):
+        return DictType.BCETT
+    return DictType.ZSDIC
+
+# Level plain zstd uses when none is given
+DEFAULT_COMPRESSION_LEVEL: int = 3
+
 class ZstdDecompressor(zstd.ZstdDecompressor):
     def __init__(self, dictionary: zstd.ZstdCompressionDict=None, format: int=zstd.FORMAT_ZSTD1) -> None:
         super().__init__(dict_data=dictionary, format=format)
@@ -36,44 +56,428 @@ class ZstdCompressor(zstd.ZstdCompressor):
     def _compress(self, data: bytes) -> bytes:
         return self.compress(data)
 
+# Chunk size for the streaming APIs
+STREAM_CHUNK_SIZE: int = 1 << 20
+# Largest possible zstd frame header, enough to read the dictionary id
+FRAME_HEADER_MAX_SIZE: int = 18
+
+# On-disk cache of decompressed files, entries are evicted least recently used first once over max_bytes
+# Eviction goes down to low_water (90% of max_bytes by default) so the directory isn't rescanned on every put
+# Keys are (path, size, mtime) of the compressed file or, with hash_contents, a hash of its contents - plus the dictionary id
+class DecompressionCache:
+    def __init__(self, cache_dir: str, max_bytes: int=4 << 30, hash_contents: bool=False, low_water: int=None) -> None:
+        self.cache_dir: Path = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes: int = max_bytes
+        self.low_water: int = max_bytes * 9 // 10 if low_water is None else min(low_water, max_bytes)
+        self.hash_contents: bool = hash_contents
+        self._lock: threading.Lock = threading.Lock()
+        self._size: int = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self) -> List[Path]:
+        return [entry for entry in self.cache_dir.iterdir() if entry.suffix == ".bin"]
+
+    def key(self, filepath: str, dict_id, data: bytes=None) -> str:
+        if self.hash_contents:
+            if data is None:
+                data = Path(filepath).read_bytes()
+            source: str = hashlib.sha256(data).hexdigest()
+        else:
+            stat: os.stat_result = os.stat(filepath)
+            source: str = "%s:%d:%d" % (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        return hashlib.sha1(f"{source}:{dict_id}".encode()).hexdigest()
+
+    # Returns a read-only map of the cached file, or None on a miss
+    def get(self, key: str) -> mmap.mmap:
+        path: Path = self.cache_dir / f"{key}.bin"
+        try:
+            with open(path, "rb") as f:
+                os.utime(path) # mtime doubles as the last access time for eviction
+                if not os.fstat(f.fileno()).st_size:
+                    return b''
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        path: Path = self.cache_dir / f"{key}.bin"
+        tmp_path: Path = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self.evict()
+
+    # Removes the least recently used entries until the cache fits in low_water
+    def evict(self) -> None:
+        entries: List[Tuple[float, int, Path]] = []
+        for entry in self._entries():
+            try:
+                stat: os.stat_result = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if self._size <= self.low_water:
+                break
+            try:
+                entry.unlink()
+            except OSError: # Still mapped on platforms that don't allow deleting open files
+                continue
+            self._size -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries():
+                entry.unlink(missing_ok=True)
+            self._size = 0
+
+# Names of the dictionaries inside ZsDic.pack.zs
+DICTIONARY_NAMES: List[str] = ["zs.zsdic", "bcett.byml.zsdic", "pack.zsdic"]
+
 class ZstdDecompContext:
-    @lru_cache
-    def __init__(self, zsdic_pack_path: str="") -> None:
+    # Parsed dictionaries are shared process-wide, keyed by the dictionary pack's path, mtime and size
+    # (De)compressor objects aren't thread-safe, so every context hands them out per thread instead
+    _registry: Dict[Tuple[str, int, int], Dict[str, zstd.ZstdCompressionDict]] = {}
+    _registry_lock: threading.RLock = threading.RLock()
+
+    # Optionally persists the extracted dictionaries under cache_dir so cold starts skip the SARC parse
+    def __init__(self, zsdic_pack_path: str="", cache_dir: str="") -> None:
+        self.dictionaries: Dict[str, zstd.ZstdCompressionDict] = self._get_dictionaries(zsdic_pack_path, cache_dir)
+        self._thread_local: threading.local = threading.local()
+        self.cache: DecompressionCache = None
+
+    @classmethod
+    def _get_dictionaries(cls, zsdic_pack_path: str, cache_dir: str="") -> Dict[str, zstd.ZstdCompressionDict]:
+        key: Tuple[str, int, int] = cls._registry_key(zsdic_pack_path)
+        with cls._registry_lock:
+            dictionaries: Dict[str, zstd.ZstdCompressionDict] = cls._registry.get(key)
+            if dictionaries is None:
+                # Drop dictionaries loaded from an older version of the same pack
+                for stale in [k for k in cls._registry if k[0] == key[0]]:
+                    del cls._registry[stale]
+                dictionaries = cls._registry[key] = cls._load_dictionaries(zsdic_pack_path, cache_dir)
+        return dictionaries
+
+    @staticmethod
+    def _registry_key(zsdic_pack_path: str) -> Tuple[str, int, int]:
+        path: str = os.path.abspath(zsdic_pack_path)
+        stat: os.stat_result = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def clear_registry(cls) -> None:
+        with cls._registry_lock:
+            cls._registry.clear()
+
+    @classmethod
+    def _load_dictionaries(cls, zsdic_pack_path: str, cache_dir: str="") -> Dict[str, zstd.ZstdCompressionDict]:
+        cache_path: Path = None
+        if cache_dir:
+            key: str = "%s:%d:%d" % cls._registry_key(zsdic_pack_path)
+            cache_path = Path(cache_dir) / hashlib.sha1(key.encode()).hexdigest()
+            if all((cache_path / name).is_file() for name in DICTIONARY_NAMES):
+                return {name: zstd.ZstdCompressionDict((cache_path / name).read_bytes()) for name in DICTIONARY_NAMES}
         vanilla_decompressor: zstd.ZstdDecompressor = zstd.ZstdDecompressor()
         if "oead" in sys.modules:
             archive: oead.Sarc = oead.Sarc(vanilla_decompressor.decompress(Path(zsdic_pack_path).read_bytes()))
-            dictionaries: Dict[str, zstd.ZstdCompressionDict] = {f.name: zstd.ZstdCompressionDict(f.data) for f in archive.get_files()}
+            data: Dict[str, bytes] = {f.name: bytes(f.data) for f in archive.get_files()}
         else:
             archive: sarc.Sarc = sarc.Sarc(vanilla_decompressor.decompress(Path(zsdic_pack_path).read_bytes()))
-            dictionaries: Dict[str, zstd.ZstdCompressionDict] = {i["Name"] : zstd.ZstdCompressionDict(i["Data"]) for i in archive.files}
-        self.pack: ZstdDecompressor = ZstdDecompressor(dictionaries["pack.zsdic"])
-        self.bcett: ZstdDecompressor = ZstdDecompressor(dictionaries["bcett.byml.zsdic"])
-        self.zs: ZstdDecompressor = ZstdDecompressor(dictionaries["zs.zsdic"])
-        self.mc: ZstdDecompressor = ZstdDecompressor(format=zstd.FORMAT_ZSTD1_MAGICLESS)
-        self.pack_compress: ZstdCompressor = ZstdCompressor(dictionaries["pack.zsdic"])
-        self.bcett_compress: ZstdCompressor = ZstdCompressor(dictionaries["bcett.byml.zsdic"])
-        self.zs_compress: ZstdCompressor = ZstdCompressor(dictionaries["zs.zsdic"])
+            data: Dict[str, bytes] = {i["Name"] : i["Data"] for i in archive.files}
+        if cache_path is not None:
+            cache_path.mkdir(parents=True, exist_ok=True)
+            for name in DICTIONARY_NAMES:
+                # Write then rename so a concurrent reader never sees a partial dictionary
+                tmp_path: Path = cache_path / f"{name}.{os.getpid()}.tmp"
+                tmp_path.write_bytes(data[name])
+                os.replace(tmp_path, cache_path / name)
+        return {name: zstd.ZstdCompressionDict(d) for name, d in data.items()}
     
-    def decompress(self, filepath: str) -> bytes:
+    # Enables the on-disk cache of decompressed files for every decompress() on this context
+    # Passing a cache to decompress() instead keeps it to that call
+    def enable_cache(self, cache_dir: str, max_bytes: int=4 << 30, hash_contents: bool=False) -> DecompressionCache:
+        self.cache = DecompressionCache(cache_dir, max_bytes, hash_contents)
+        return self.cache
+
+    # With a cache (given or enabled on the context) the result is a read-only memoryview, backed by a map of the
+    # cached file on hits and misses alike, otherwise bytes
+    def decompress(self, filepath: str, cache: DecompressionCache=None) -> Union[bytes, memoryview]:
+        cache = cache or self.cache
         if not(filepath.endswith(".zs") or filepath.endswith(".zstd") or filepath.endswith(".mc")):
-            return Path(filepath).read_bytes()
+            data: bytes = Path(filepath).read_bytes()
+            return data if cache is None else memoryview(data)
+        if cache is not None:
+            return self._decompress_cached(filepath, cache)
         elif filepath.endswith(".mc"):
-            return self.mc._decompress(Path(filepath).read_bytes()[0xc:])
+            return self.mc.decompress(memoryview(Path(filepath).read_bytes())[0xc:])
         data: bytes = Path(filepath).read_bytes()
-        id: int = zstd.get_frame_parameters(data).dict_id
-        if id == 1:
-            return self.zs._decompress(data)
-        elif id == 2:
-            return self.bcett._decompress(data)
-        elif id == 3:
-            return self.pack._decompress(data)
+        return self.get_decompressor(data).decompress(data)
+
+    def _decompress_cached(self, filepath: str, cache: DecompressionCache) -> memoryview:
+        data: bytes = None
+        if filepath.endswith(".mc"):
+            dict_id = "mc"
+        elif cache.hash_contents:
+            data = Path(filepath).read_bytes()
+            dict_id = zstd.get_frame_parameters(data).dict_id
         else:
-            return self.zs._decompress(data)
+            with open(filepath, "rb") as f:
+                dict_id = zstd.get_frame_parameters(f.read(FRAME_HEADER_MAX_SIZE)).dict_id
+        key: str = cache.key(filepath, dict_id, data)
+        cached: mmap.mmap = cache.get(key)
+        if cached is not None:
+            return memoryview(cached)
+        if data is None:
+            data = Path(filepath).read_bytes()
+        if filepath.endswith(".mc"):
+            result: bytes = self.mc.decompress(memoryview(data)[0xc:])
+        else:
+            result: bytes = self.get_decompressor(data).decompress(data)
+        cache.put(key, result)
+        # Served from the new entry like a hit would be, unless it was evicted straight away
+        cached = cache.get(key)
+        return memoryview(result if cached is None else cached)
     
-    def compress(self, filepath: str, dict: DictType = DictType.ZSDIC) -> bytes:
-        if dict == DictType.PACK:
-            return self.pack_compress._compress(Path(filepath).read_bytes())
-        elif dict == DictType.BCETT:
-            return self.bcett_compress._compress(Path(filepath).read_bytes())
+    def compress(self, filepath: str, dict: DictType = DictType.ZSDIC, level: int=None, threads: int=0) -> bytes:
+        return self.compress_data(Path(filepath).read_bytes(), dict=dict, level=level, threads=threads)
+
+    # The calling thread's (de)compressors, built on first use
+    # Each thread also gets its own dictionary objects, and plain zstandard objects since some zstandard versions
+    # crash when freeing subclassed (de)compressors that have been used from several threads
+    def _thread_objects(self) -> threading.local:
+        local: threading.local = self._thread_local
+        if not hasattr(local, "decompressors"):
+            dictionaries: Dict[str, zstd.ZstdCompressionDict] = {
+                name: zstd.ZstdCompressionDict(d.as_bytes()) for name, d in self.dictionaries.items()
+            }
+            local.dictionaries = dictionaries
+            local.decompressors = {
+                1: zstd.ZstdDecompressor(dict_data=dictionaries["zs.zsdic"]),
+                2: zstd.ZstdDecompressor(dict_data=dictionaries["bcett.byml.zsdic"]),
+                3: zstd.ZstdDecompressor(dict_data=dictionaries["pack.zsdic"]),
+            }
+            local.mc = zstd.ZstdDecompressor(format=zstd.FORMAT_ZSTD1_MAGICLESS)
+            local.compressors = {
+                DictType.ZSDIC: zstd.ZstdCompressor(dict_data=dictionaries["zs.zsdic"]),
+                DictType.BCETT: zstd.ZstdCompressor(dict_data=dictionaries["bcett.byml.zsdic"]),
+                DictType.PACK: zstd.ZstdCompressor(dict_data=dictionaries["pack.zsdic"]),
+            }
+            # compress_data's compressors for non-default levels and thread counts, keyed by (dict, level, threads)
+            local.level_compressors = {}
+        return local
+
+    # Picks the calling thread's decompressor matching the dictionary id in the frame header (only the header is needed)
+    def get_decompressor(self, data: bytes) -> zstd.ZstdDecompressor:
+        decompressors: Dict[int, zstd.ZstdDecompressor] = self._thread_objects().decompressors
+        return decompressors.get(zstd.get_frame_parameters(data).dict_id, decompressors[1])
+
+    # Same as get_decompressor, kept for callers written when only worker threads got their own decompressors
+    def get_thread_decompressor(self, data: bytes) -> zstd.ZstdDecompressor:
+        return self.get_decompressor(data)
+
+    def get_compressor(self, dict: DictType = DictType.ZSDIC) -> zstd.ZstdCompressor:
+        compressors: Dict[DictType, zstd.ZstdCompressor] = self._thread_objects().compressors
+        return compressors.get(dict, compressors[DictType.ZSDIC])
+
+    # The calling thread's (de)compressors for each dictionary
+    @property
+    def pack(self) -> zstd.ZstdDecompressor:
+        return self._thread_objects().decompressors[3]
+
+    @property
+    def bcett(self) -> zstd.ZstdDecompressor:
+        return self._thread_objects().decompressors[2]
+
+    @property
+    def zs(self) -> zstd.ZstdDecompressor:
+        return self._thread_objects().decompressors[1]
+
+    @property
+    def mc(self) -> zstd.ZstdDecompressor:
+        return self._thread_objects().mc
+
+    @property
+    def pack_compress(self) -> zstd.ZstdCompressor:
+        return self.get_compressor(DictType.PACK)
+
+    @property
+    def bcett_compress(self) -> zstd.ZstdCompressor:
+        return self.get_compressor(DictType.BCETT)
+
+    @property
+    def zs_compress(self) -> zstd.ZstdCompressor:
+        return self.get_compressor(DictType.ZSDIC)
+
+    # Compresses data already in memory (bytes or any buffer)
+    # The dictionary is picked from filename unless given, threads > 0 (or -1 for all cores) enables multi-threaded zstd
+    def compress_data(self, data: bytes, filename: str="", dict: DictType=None, level: int=None, threads: int=0) -> bytes:
+        if dict is None:
+            dict = get_dict_type(filename)
+        if level is None and not threads:
+            return self.get_compressor(dict).compress(data)
+        key: Tuple[DictType, int, int] = (dict, DEFAULT_COMPRESSION_LEVEL if level is None else level, threads)
+        local: threading.local = self._thread_objects()
+        compressor: zstd.ZstdCompressor = local.level_compressors.get(key)
+        if compressor is None:
+            dictionary: zstd.ZstdCompressionDict = local.dictionaries[{DictType.PACK: "pack.zsdic", DictType.BCETT: "bcett.byml.zsdic"}.get(dict, "zs.zsdic")]
+            compressor = zstd.ZstdCompressor(dict_data=dictionary, level=key[1], threads=threads)
+            local.level_compressors[key] = compressor
+        return compressor.compress(data)
+
+    # Streaming version of decompress - source and destination can be paths or file objects, destination
+    # can also be a bytearray (appended to) or a writable buffer (filled from the start)
+    # File objects are treated as .mc if their name says so, otherwise by whether they start with a zstd frame
+    # Returns (bytes read, bytes written)
+    def decompress_stream(self, source, destination, chunk_size: int=STREAM_CHUNK_SIZE) -> Tuple[int, int]:
+        name: str = os.fspath(source) if isinstance(source, (str, os.PathLike)) else str(getattr(source, "name", ""))
+        with contextlib.ExitStack() as stack:
+            reader: _CountingReader = _CountingReader(_open_source(source, stack))
+            writer: _CountingWriter = _open_destination(destination, stack)
+            if name.endswith(".mc"):
+                reader.read(0xc)
+                decompressor: zstd.ZstdDecompressor = self.mc
+            else:
+                header: bytes = reader.read(FRAME_HEADER_MAX_SIZE)
+                reader.unread(header)
+                if header[:4] != zstd.FRAME_HEADER:
+                    _copy_stream(reader, writer, chunk_size)
+                    return reader.bytes_read, writer.bytes_written
+                decompressor: zstd.ZstdDecompressor = self.get_decompressor(header)
+            with decompressor.stream_reader(reader, read_size=chunk_size, read_across_frames=True, closefd=False) as stream:
+                _copy_stream(stream, writer, chunk_size)
+            return reader.bytes_read, writer.bytes_written
+
+    # Streaming version of compress, takes the same kinds of source/destination as decompress_stream
+    # The decompressed size is stored in the frame header when the source size is known
+    # Returns (bytes read, bytes written)
+    def compress_stream(self, source, destination, dict: DictType = DictType.ZSDIC, chunk_size: int=STREAM_CHUNK_SIZE) -> Tuple[int, int]:
+        with contextlib.ExitStack() as stack:
+            reader: _CountingReader = _CountingReader(_open_source(source, stack))
+            writer: _CountingWriter = _open_destination(destination, stack)
+            compressor: zstd.ZstdCompressor = self.get_compressor(dict)
+            with compressor.stream_writer(writer, size=_source_size(reader.stream), closefd=False) as stream:
+                _copy_stream(reader, stream, chunk_size)
+            return reader.bytes_read, writer.bytes_written
+
+    # Decompresses every .zs/.zstd file under src into the same layout under dst (without the extension)
+    # Files are spread over a thread pool, zstd releases the GIL while decompressing
+    # progress(done, total, path) is called from the calling thread as each file finishes
+    # Returns the list of written files
+    def decompress_tree(self, src: str, dst: str, workers: int=None, progress=None) -> List[str]:
+        jobs: List[Tuple[str, str]] = []
+        directories: set = set()
+        for root_dir, dirs, files in os.walk(src):
+            for file in files:
+                stem, ext = os.path.splitext(file)
+                if ext not in (".zs", ".zstd"):
+                    continue
+                output_dir: str = os.path.join(dst, os.path.relpath(root_dir, src))
+                directories.add(output_dir)
+                jobs.append((os.path.join(root_dir, file), os.path.join(output_dir, stem)))
+        for directory in directories:
+            os.makedirs(directory, exist_ok=True)
+        written: List[str] = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = [executor.submit(self._decompress_file, input_path, output_path) for input_path, output_path in jobs]
+            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                written.append(future.result())
+                if progress is not None:
+                    progress(i + 1, len(jobs), written[-1])
+        return written
+
+    def _decompress_file(self, input_path: str, output_path: str) -> str:
+        data: bytes = Path(input_path).read_bytes()
+        decompressor: zstd.ZstdDecompressor = self.get_thread_decompressor(data)
+        if zstd.get_frame_parameters(data).content_size not in (0, zstd.CONTENTSIZE_UNKNOWN):
+            result: bytes = decompressor.decompress(data)
+        else: # Size isn't in the frame header so decompress() can't be used
+            result: bytes = decompressor.decompressobj().decompress(data)
+        with open(output_path, "wb") as f:
+            f.write(result)
+        return output_path
+
+class _CountingReader:
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.bytes_read: int = 0
+        self._pending: bytes = b''
+
+    # Pushes already read bytes back so they are returned again by the next read
+    def unread(self, data: bytes) -> None:
+        self._pending = data + self._pending
+        self.bytes_read -= len(data)
+
+    def read(self, size: int=-1) -> bytes:
+        if self._pending:
+            if size < 0:
+                data = self._pending + self.stream.read()
+                self._pending = b''
+            else:
+                data, self._pending = self._pending[:size], self._pending[size:]
+        else:
+            data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+class _CountingWriter:
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.bytes_written: int = 0
+
+    def write(self, data) -> int:
+        self.stream.write(data)
+        size: int = len(memoryview(data))
+        self.bytes_written += size
+        return size
+
+    def flush(self) -> None:
+        if hasattr(self.stream, "flush"):
+            self.stream.flush()
+
+# Fills a caller-provided buffer, bytearrays grow as needed
+class _BufferWriter:
+    def __init__(self, buffer) -> None:
+        self._buffer = buffer
+        self._view: memoryview = None if isinstance(buffer, bytearray) else memoryview(buffer).cast("B")
+        self._pos: int = 0
+
+    def write(self, data) -> int:
+        size: int = len(memoryview(data))
+        if self._view is None:
+            self._buffer += data
         else:
-            return self.zs_compress._compress(Path(filepath).read_bytes())
\ No newline at end of file
+            if self._pos + size > len(self._view):
+                raise ValueError("Destination buffer is too small")
+            self._view[self._pos:self._pos + size] = data
+            self._pos += size
+        return size
+
+def _open_source(source, stack: contextlib.ExitStack):
+    if isinstance(source, (str, os.PathLike)):
+        return stack.enter_context(open(source, "rb"))
+    return source
+
+def _open_destination(destination, stack: contextlib.ExitStack) -> _CountingWriter:
+    if isinstance(destination, (str, os.PathLike)):
+        return _CountingWriter(stack.enter_context(open(destination, "wb")))
+    if hasattr(destination, "write"):
+        return _CountingWriter(destination)
+    return _CountingWriter(_BufferWriter(destination))
+
+def _source_size(source) -> int:
+    try:
+        return os.fstat(source.fileno()).st_size - source.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return -1
+
+def _copy_stream(source, destination, chunk_size: int) -> None:
+    while True:
+        chunk: bytes = source.read(chunk_size)
+        if not chunk:
+            break
+        destination.write(chunk)